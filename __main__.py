@@ -3,7 +3,11 @@ def menu():
     print("What's the programming language you want to learn? ")
     print("1. Running the Game")
     print("2. Running the AI")
-    print("3. exit")
+    print("3. Training the AI (headless)")
+    print("4. Training the AI (multi-process)")
+    print("5. Benchmark")
+    print("6. Evaluating the AI")
+    print("7. exit")
 
 if __name__ == "__main__":
     menu()
@@ -18,6 +22,22 @@ if __name__ == "__main__":
             train()
             pass
         case 3:
+            from ai.agent import train
+            train(headless=True, resume=True)
+            pass
+        case 4:
+            from ai.distributed import train_distributed
+            train_distributed()
+            pass
+        case 5:
+            from ai.benchmark import run_suite
+            run_suite()
+            pass
+        case 6:
+            from ai.evaluate import evaluate
+            evaluate()
+            pass
+        case 7:
             exit(0)
             pass
         case _:
@@ -1,10 +1,13 @@
 from settings import *
 from .snake_ai import SnakeGameAI, Direction, Point
-from .model import Linear_QNet, QTrainer
-from .plot import plot
+from .model import Linear_QNet, Conv_QNet, QTrainer, InputBuffers, set_threads
+from .vector_env import VectorSnakeEnv
+from .memory import ReplayBuffer, PrioritizedReplayBuffer
+from .state import make_encoder
+from .metrics import MetricsWriter, start_plotter
+from .checkpoint import Checkpointer, seed_everything
 import numpy as np
 import random
-from collections import deque
 import torch
 
 class Agent:
@@ -15,14 +18,28 @@ class Agent:
     -----------
     n_games : int
         The number of games played.
+    n_steps : int
+        The number of moves learned from.
+    short_memory : bool
+        Whether learn() takes a gradient step on every move.
+    train_every : int
+        Moves between the replay batches learn() trains on (0 disables them).
     epsilon : float
         The exploration rate.
     gamma : float
         The discount factor for future rewards.
-    memory : deque
-        Memory buffer for storing experience tuples.
-    model : Linear_QNet
-        The Q-learning model.
+    memory : ReplayBuffer
+        Preallocated ring buffer of experience transitions, prioritized by TD error
+        when the agent is created with prioritized=True. It replays n_step returns.
+    encoder : StateEncoder or GridEncoder
+        Builds the observations: the 11 features, or with observation='grid' or
+        'grid_age' an image of the cols x rows board.
+    frame_stack : int
+        The number of observations stacked into each state, the newest last.
+    state_shape : tuple
+        The shape of the stacked states.
+    model : Linear_QNet or Conv_QNet
+        The Q-learning model, convolutional for grid observations.
     trainer : QTrainer
         The trainer for the Q-learning model.
 
@@ -36,16 +53,42 @@ class Agent:
         Trains the model on a batch of experiences from the memory buffer.
     train_short_memory(state, action, reward, next_state, done):
         Trains the model on a single experience tuple.
+    learn(state, action, reward, next_state, done):
+        Learns from one move on the configured training schedule.
     get_action(state):
         Determines the next action to take based on the current state.
+    get_actions(states):
+        Determines the next actions for a batch of states.
     """
-    def __init__(self):
+    def __init__(self, prioritized=PRIORITIZED_REPLAY, short_memory=TRAIN_SHORT_MEMORY, train_every=TRAIN_EVERY,
+                 target_sync=TARGET_SYNC, tau=TARGET_TAU, double=DOUBLE_DQN, observation=OBSERVATION,
+                 cols=COLS, rows=ROWS, frame_stack=FRAME_STACK, n_step=N_STEP, streams=1):
         self.n_games = 0
+        self.n_steps = 0
+        self.short_memory = short_memory
+        self.train_every = train_every
         self.epsilon = 0  # randomness
         self.gamma = 0.9  # discount rate
-        self.memory = deque(maxlen=MAX_MEMORY)  # popleft()
-        self.model = Linear_QNet(11, 256, 3)
-        self.trainer = QTrainer(self.model, lr=LR, gamma=self.gamma)
+        self.prioritized = prioritized
+        self.observation = observation
+        self.frame_stack = frame_stack
+        self.encoder = make_encoder(observation, cols, rows)
+        capacity = MAX_MEMORY if observation == 'features' else GRID_MAX_MEMORY
+        depth, *rest = self.encoder.shape
+        self.state_shape = (frame_stack * depth, *rest)
+        if observation == 'features':
+            self.model = Linear_QNet(self.state_shape[0], 256, 3)
+        else:
+            self.model = Conv_QNet(self.state_shape[0], 3)
+        self.trainer = QTrainer(self.model, lr=LR, gamma=self.gamma, target_sync=target_sync, tau=tau, double=double)
+        # Overwrites the oldest when full; each observation is stored once, unstacked
+        replay = PrioritizedReplayBuffer if prioritized else ReplayBuffer
+        self.memory = replay(capacity, self.encoder.shape, n_step=n_step, gamma=self.trainer.gamma,
+                             frame_stack=frame_stack, streams=streams)
+        self._inputs = InputBuffers()
+        self._stack = np.zeros(self.state_shape, dtype=np.uint8)
+        self._stack_game = None
+        self._stack_frame = None
 
     def get_state(self, game: SnakeGameAI):
         """
@@ -59,52 +102,24 @@ class Agent:
         Returns:
         --------
         np.ndarray
-            The current state of the game.
+            The current state of the game as 11 uint8 features: danger straight, right
+            and left, move direction left, right, up and down, and food left, right, up
+            and down. With grid observations, the (channels, rows, cols) board image.
+            With frame_stack > 1, the last frame_stack observations of the game
+            concatenated along the first axis, zeros before its first move.
         """
-        head = game.snake[0]
-        point_l = Point(head.x - BLOCK_SIZE, head.y)
-        point_r = Point(head.x + BLOCK_SIZE, head.y)
-        point_u = Point(head.x, head.y - BLOCK_SIZE)
-        point_d = Point(head.x, head.y + BLOCK_SIZE)
-        
-        dir_l = game.direction == Direction.LEFT
-        dir_r = game.direction == Direction.RIGHT
-        dir_u = game.direction == Direction.UP
-        dir_d = game.direction == Direction.DOWN
-
-        state = [
-            # Danger straight
-            (dir_r and game.is_collision(point_r)) or 
-            (dir_l and game.is_collision(point_l)) or 
-            (dir_u and game.is_collision(point_u)) or 
-            (dir_d and game.is_collision(point_d)),
-
-            # Danger right
-            (dir_u and game.is_collision(point_r)) or 
-            (dir_d and game.is_collision(point_l)) or 
-            (dir_l and game.is_collision(point_u)) or 
-            (dir_r and game.is_collision(point_d)),
-
-            # Danger left
-            (dir_d and game.is_collision(point_r)) or 
-            (dir_u and game.is_collision(point_l)) or 
-            (dir_r and game.is_collision(point_u)) or 
-            (dir_l and game.is_collision(point_d)),
-            
-            # Move direction
-            dir_l,
-            dir_r,
-            dir_u,
-            dir_d,
-            
-            # Food location 
-            game.food.x < game.head.x,  # food left
-            game.food.x > game.head.x,  # food right
-            game.food.y < game.head.y,  # food up
-            game.food.y > game.head.y  # food down
-        ]
-
-        return np.array(state, dtype=int)
+        if self.frame_stack == 1:
+            return self.encoder.encode(game).copy()
+        # The state before a move is asked for again as the state after the previous one
+        if game is not self._stack_game or game.frame_iteration != self._stack_frame:
+            depth = self.encoder.shape[0]
+            if game is self._stack_game and game.frame_iteration:
+                self._stack[:-depth] = self._stack[depth:]
+            else:
+                self._stack[:-depth] = 0
+            self.encoder.encode(game, out=self._stack[-depth:])
+            self._stack_game, self._stack_frame = game, game.frame_iteration
+        return self._stack.copy()
 
     def remember(self, state, action, reward, next_state, done):
         """
@@ -123,19 +138,30 @@ class Agent:
         done : bool
             Whether the episode has ended.
         """
-        self.memory.append((state, action, reward, next_state, done))  # popleft if MAX_MEMORY is reached
+        self.memory.append(state, action, reward, next_state, done)  # overwrites the oldest if MAX_MEMORY is reached
 
-    def train_long_memory(self):
+    def train_long_memory(self, batch_size=BATCH_SIZE):
         """
-        Trains the model on a batch of experiences from the memory buffer.
+        Trains the model on a batch of experiences from the memory buffer, as n_step
+        discounted returns bootstrapped n_step moves later. With prioritized replay the
+        batch is weighted by importance sampling and the TD errors become the new
+        priorities of the sampled transitions.
+
+        Parameters:
+        -----------
+        batch_size : int
+            The number of experiences sampled.
         """
-        if len(self.memory) > BATCH_SIZE:
-            mini_sample = random.sample(self.memory, BATCH_SIZE)  # list of tuples
+        n_step = self.memory.n_step
+        if self.prioritized:
+            states, actions, rewards, next_states, dones, weights, idx = self.memory.sample(batch_size)
+            if len(idx):
+                errors = self.trainer.train_batch(states, actions, rewards, next_states, dones, weights, n_step)
+                self.memory.update_priorities(idx, errors.numpy())
         else:
-            mini_sample = self.memory
-
-        states, actions, rewards, next_states, dones = zip(*mini_sample)
-        self.trainer.train_step(states, actions, rewards, next_states, dones)
+            states, actions, rewards, next_states, dones = self.memory.sample(batch_size)
+            if len(actions):
+                self.trainer.train_batch(states, actions, rewards, next_states, dones, n_step=n_step)
 
     def train_short_memory(self, state, action, reward, next_state, done):
         """
@@ -156,6 +182,22 @@ class Agent:
         """
         self.trainer.train_step(state, action, reward, next_state, done)
 
+    def learn(self, state, action, reward, next_state, done):
+        """
+        Learns from one move: a gradient step on it unless short_memory is off, then it is
+        remembered, and every train_every moves the model trains on a replay batch. Turning
+        short_memory off and training every N moves trades many single-sample updates for
+        fewer, larger ones.
+
+        Parameters are those of remember().
+        """
+        if self.short_memory:
+            self.train_short_memory(state, action, reward, next_state, done)
+        self.remember(state, action, reward, next_state, done)
+        self.n_steps += 1
+        if self.train_every and self.n_steps % self.train_every == 0:
+            self.train_long_memory()
+
     def get_action(self, state):
         """
         Determines the next action to take based on the current state.
@@ -170,31 +212,133 @@ class Agent:
         list
             The action to be taken.
         """
-        # Random moves: tradeoff exploration / exploitation
         self.epsilon = 80 - self.n_games
-        final_move = [0, 0, 0]
-        if random.randint(0, 200) < self.epsilon:
-            move = random.randint(0, 2)
-            final_move[move] = 1
-        else:
-            state0 = torch.tensor(state, dtype=torch.float)
-            prediction = self.model(state0)
-            move = torch.argmax(prediction).item()
-            final_move[move] = 1
+        return epsilon_greedy(self.model, self._inputs, state, self.epsilon)
+
+    def get_actions(self, states):
+        """
+        Determines the next actions for a batch of states with a single forward pass.
+
+        Parameters:
+        -----------
+        states : np.ndarray
+            (K, 11) array of states, or (K, channels, rows, cols) grid observations.
 
-        return final_move
+        Returns:
+        --------
+        np.ndarray
+            (K, 3) one-hot actions.
+        """
+        self.epsilon = 80 - self.n_games
+        with torch.no_grad():
+            moves = torch.argmax(self.model(self._inputs.put('states', states)), dim=1).numpy()
+        explore = np.random.randint(0, 201, size=len(states)) < self.epsilon
+        moves[explore] = np.random.randint(0, 3, size=int(explore.sum()))
+        return np.eye(3, dtype=int)[moves]
 
 
-def train():
+def epsilon_greedy(model, inputs, state, epsilon):
+    """
+    Returns a random move with probability epsilon / 201, the model's greedy move otherwise.
+
+    Parameters:
+    -----------
+    model : Linear_QNet or Conv_QNet
+        The policy.
+    inputs : InputBuffers
+        The tensors the state is copied into.
+    state : np.ndarray
+        The current state.
+    epsilon : int
+        The exploration rate, 80 minus the number of games played.
+
+    Returns:
+    --------
+    list
+        The move, one-hot over [straight, right, left].
+    """
+    # Random moves: tradeoff exploration / exploitation
+    final_move = [0, 0, 0]
+    if random.randint(0, 200) < epsilon:
+        move = random.randint(0, 2)
+    else:
+        with torch.no_grad():
+            move = torch.argmax(model(inputs.put('state', state))).item()
+    final_move[move] = 1
+    return final_move
+
+
+def board_size(n_games, curriculum, cols=COLS, rows=ROWS):
+    """
+    Returns the board size for the next game of a curriculum.
+
+    Parameters:
+    -----------
+    n_games : int
+        The number of games played so far.
+    curriculum : list
+        (from_game, cols, rows) stages sorted by from_game, or None.
+    cols, rows : int
+        The size used before the first stage starts, or without a curriculum.
+
+    Returns:
+    --------
+    tuple
+        (cols, rows) of the latest stage that has started.
+    """
+    for start, stage_cols, stage_rows in curriculum or ():
+        if n_games >= start:
+            cols, rows = stage_cols, stage_rows
+    return cols, rows
+
+
+def train(headless=HEADLESS, render_every=RENDER_EVERY, prioritized=PRIORITIZED_REPLAY, plot=None,
+          resume=False, seed=SEED, cols=COLS, rows=ROWS, curriculum=CURRICULUM):
     """
     Trains the Snake AI using a Deep Q-learning algorithm.
+
+    Parameters:
+    -----------
+    headless : bool
+        Runs the game without a window and without a frame limit.
+    render_every : int
+        When headless, renders every N-th game so the policy can be spot-checked.
+        0 disables rendering entirely.
+    prioritized : bool
+        Samples the replay memory by TD error instead of uniformly.
+    plot : bool
+        Plots the metrics file live from a separate process. Defaults to PLOT_TRAINING,
+        and to off when headless.
+    resume : bool
+        Continues from the newest checkpoint in CHECKPOINT_DIR, if there is one.
+    seed : int
+        Seeds Python, NumPy and torch for a reproducible run.
+    cols, rows : int
+        The board size in cells.
+    curriculum : list
+        Optional (from_game, cols, rows) stages that change the board size as training
+        progresses, e.g. [(0, 10, 10), (200, 20, 20)]. Only with OBSERVATION = 'features',
+        since grid observations are sized to the board.
     """
-    plot_scores = []
-    plot_mean_scores = []
+    if curriculum and OBSERVATION != 'features':
+        raise ValueError('a board size curriculum needs the size-independent feature observation')
+    set_threads()
+    if seed is not None:
+        seed_everything(seed)
     total_score = 0
     record = 0
-    agent = Agent()
-    game = SnakeGameAI()
+    agent = Agent(prioritized=prioritized, cols=cols, rows=rows)
+    checkpointer = Checkpointer()
+    extra = checkpointer.load(agent) if resume else None
+    if extra is not None:
+        total_score, record = extra['total_score'], extra['record']
+        print('Resumed at game', agent.n_games, 'Record:', record)
+    game = SnakeGameAI(headless, *board_size(agent.n_games, curriculum, cols, rows))
+    metrics = MetricsWriter(append=extra is not None)
+    if plot is None:
+        plot = PLOT_TRAINING and not headless
+    if plot:
+        start_plotter(metrics.path)
 
     while True:
         # Get old state
@@ -207,15 +351,11 @@ def train():
         reward, done, score = game.play_step(final_move)
         state_new = agent.get_state(game)
 
-        # Train short memory
-        agent.train_short_memory(state_old, final_move, reward, state_new, done)
-
-        # Remember
-        agent.remember(state_old, final_move, reward, state_new, done)
+        # Train short memory and remember, on the agent's training schedule
+        agent.learn(state_old, final_move, reward, state_new, done)
 
         if done:
-            # Train long memory, plot result
-            game.reset()
+            # Train long memory, log result
             agent.n_games += 1
             agent.train_long_memory()
 
@@ -225,11 +365,79 @@ def train():
 
             print('Game', agent.n_games, 'Score', score, 'Record:', record)
 
-            plot_scores.append(score)
             total_score += score
             mean_score = total_score / agent.n_games
-            plot_mean_scores.append(mean_score)
-            plot(plot_scores, plot_mean_scores)
+            metrics.log(game=agent.n_games, score=score, mean_score=mean_score, record=record)
+
+            # Checkpoint before the next game draws its food, so a resumed run replays it exactly
+            checkpointer.maybe_save(agent, total_score=total_score, record=record)
+            size = board_size(agent.n_games, curriculum, cols, rows)
+            if size != (game.cols, game.rows):
+                print('Board size', *size)
+                game = SnakeGameAI(headless, *size)
+            else:
+                game.reset()
+            if headless:
+                game.render = render_every > 0 and agent.n_games % render_every == 0
+
+
+def train_vectorized(num_envs=VECTOR_ENVS, prioritized=PRIORITIZED_REPLAY, cols=COLS, rows=ROWS):
+    """
+    Trains the Snake AI on a VectorSnakeEnv, stepping many games per model call.
+
+    Parameters:
+    -----------
+    num_envs : int
+        The number of games stepped in lockstep.
+    prioritized : bool
+        Samples the replay memory by TD error instead of uniformly.
+    cols, rows : int
+        The board size in cells.
+    """
+    set_threads()
+    total_score = 0
+    record = 0
+    agent = Agent(prioritized=prioritized, cols=cols, rows=rows, streams=num_envs)
+    env = VectorSnakeEnv(num_envs, cols, rows)
+    metrics = MetricsWriter()
+    depth = agent.encoder.shape[0]
+    frames = np.empty((num_envs, *agent.encoder.shape), dtype=np.uint8)
+    states_old = np.zeros((num_envs, *agent.state_shape), dtype=np.uint8)
+    states_new = np.empty_like(states_old)
+    agent.encoder.encode_batch(env, out=frames)
+    states_old[:, -depth:] = frames
+
+    while True:
+        final_moves = agent.get_actions(states_old)
+        rewards, dones, scores = env.step(final_moves)
+        # Finished games are already reset, their next state is never bootstrapped from
+        agent.encoder.encode_batch(env, out=frames)
+        states_new[:, :-depth] = states_old[:, depth:]
+        states_new[:, -depth:] = frames
+        states_new[dones, :-depth] = 0
+
+        if agent.short_memory:
+            agent.train_short_memory(states_old, final_moves, rewards, states_new, dones)
+        agent.memory.extend(states_old, final_moves.argmax(axis=1), rewards, states_new, dones)
+        if agent.train_every:
+            for _ in range((agent.n_steps + num_envs) // agent.train_every - agent.n_steps // agent.train_every):
+                agent.train_long_memory()
+        agent.n_steps += num_envs
+
+        for score in scores[dones]:
+            agent.n_games += 1
+            agent.train_long_memory()
+
+            if score > record:
+                record = score
+                agent.model.save()
+
+            total_score += score
+            mean_score = total_score / agent.n_games
+            print('Game', agent.n_games, 'Score', score, 'Record:', record, 'Mean:', round(mean_score, 2))
+            metrics.log(game=agent.n_games, score=score, mean_score=mean_score, record=record)
+
+        states_old, states_new = states_new, states_old
 
 
 if __name__ == '__main__':
@@ -0,0 +1,942 @@
+from settings import *
+from api.board import Board
+from .model import Linear_QNet, QTrainer, quantize, set_threads
+from .memory import ReplayBuffer, PrioritizedReplayBuffer
+from .agent import Agent
+from .runtime import MLPPolicy
+from .snake_ai import SnakeGameAI
+from .state import CLOCK_WISE, MOVES
+from .vector_env import VectorSnakeEnv
+from .checkpoint import seed_everything
+from collections import deque
+import argparse
+import copy
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import torch
+
+
+# Training schedules compared by --schedules: name and Agent arguments
+SCHEDULES = [
+    ('per-move updates', dict(short_memory=True, train_every=0, target_sync=0, tau=0.0, double=False)),
+    ('batch every 4 moves', dict(short_memory=False, train_every=4, target_sync=0, tau=0.0, double=False)),
+    ('batch every 4, hard target sync 250', dict(short_memory=False, train_every=4, target_sync=250, tau=0.0, double=False)),
+    ('batch every 4, double DQN, tau 0.01', dict(short_memory=False, train_every=4, target_sync=0, tau=0.01, double=True)),
+    ('batch every 4, hard target sync 250, 3-step returns',
+     dict(short_memory=False, train_every=4, target_sync=250, tau=0.0, double=False, n_step=3)),
+]
+
+
+def _loop_train_step(trainer, state, action, reward, next_state, done):
+    """
+    Reference implementation of QTrainer.train_step with one forward pass per sample,
+    as it was before the Bellman targets were vectorized. Used to check and time the
+    batched version against.
+    """
+    state = torch.tensor(np.array(state), dtype=torch.float)
+    next_state = torch.tensor(np.array(next_state), dtype=torch.float)
+    action = torch.tensor(np.array(action), dtype=torch.long)
+    reward = torch.tensor(np.array(reward), dtype=torch.float)
+
+    pred = trainer.model(state)
+    target = pred.clone()
+    for idx in range(len(done)):
+        Q_new = reward[idx]
+        if not done[idx]:
+            Q_new = reward[idx] + trainer.gamma * torch.max(trainer.model(next_state[idx]))
+        target[idx][torch.argmax(action[idx]).item()] = Q_new
+
+    trainer.optimizer.zero_grad()
+    loss = trainer.criterion(target, pred)
+    loss.backward()
+    trainer.optimizer.step()
+
+
+def random_batch(batch_size, rng):
+    """
+    Returns a random batch of (state, action, reward, next_state, done) in the Agent's format,
+    consecutive moves of one game: each next state is the following state.
+    """
+    frames = rng.integers(0, 2, size=(batch_size + 1, 11))
+    states, next_states = frames[:-1], frames[1:]
+    actions = np.eye(3, dtype=int)[rng.integers(0, 3, size=batch_size)]
+    rewards = rng.choice([-10.0, 0.0, 10.0], size=batch_size)
+    dones = rng.random(batch_size) < 0.1
+    return states, actions, rewards, next_states, dones
+
+
+def bench_train_step(batch_sizes=(1, 32, 1000), repeats=20, seed=0):
+    """
+    Times the per-sample loop against the vectorized QTrainer.train_step and checks that
+    both leave the model with the same parameters.
+
+    Parameters:
+    -----------
+    batch_sizes : tuple
+        The batch sizes to time.
+    repeats : int
+        The number of training steps timed per batch size.
+    seed : int
+        Seed for the model initialisation and the random batches.
+
+    Returns:
+    --------
+    list
+        One dict per batch size with the per-step time of each implementation and the speedup.
+    """
+    results = []
+    for batch_size in batch_sizes:
+        torch.manual_seed(seed)
+        rng = np.random.default_rng(seed)
+        batch = random_batch(batch_size, rng)
+
+        model = Linear_QNet(11, 256, 3)
+        reference = copy.deepcopy(model)
+        trainer = QTrainer(model, lr=LR, gamma=0.9)
+        reference_trainer = QTrainer(reference, lr=LR, gamma=0.9)
+
+        trainer.train_step(*batch)
+        _loop_train_step(reference_trainer, *batch)
+        max_diff = max((a - b).abs().max().item() for a, b in zip(model.parameters(), reference.parameters()))
+
+        timings = {}
+        for name, step, t in (('loop', _loop_train_step, reference_trainer), ('vectorized', QTrainer.train_step, trainer)):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                step(t, *batch)
+            timings[name] = (time.perf_counter() - start) / repeats
+
+        results.append({
+            'batch_size': batch_size,
+            'loop_ms': timings['loop'] * 1000,
+            'vectorized_ms': timings['vectorized'] * 1000,
+            'speedup': timings['loop'] / timings['vectorized'],
+            'max_param_diff': max_diff,
+        })
+    return results
+
+
+def bench_replay_sampling(capacity=MAX_MEMORY, batch_size=BATCH_SIZE, repeats=20, seed=0):
+    """
+    Compares the old tuple deque with ReplayBuffer: memory held by the stored transitions
+    and the time to sample a batch and turn it into training tensors.
+
+    Returns:
+    --------
+    dict
+        The approximate memory in MB and the per-batch sampling time in ms of each store.
+    """
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+    states, actions, rewards, next_states, dones = random_batch(capacity, rng)
+    states = states.astype(int)
+    next_states = next_states.astype(int)
+
+    memory = deque(maxlen=capacity)
+    for transition in zip(states, actions.tolist(), rewards, next_states, dones):
+        memory.append(transition)
+    buffer = ReplayBuffer(capacity, seed=seed)
+    buffer.extend(states, actions.argmax(axis=1), rewards, next_states, dones)
+
+    # Per transition: the tuple, its two state arrays and the action list
+    state_bytes = sys.getsizeof(states[0]) + states[0].nbytes
+    deque_bytes = sys.getsizeof(memory) + capacity * (
+        sys.getsizeof(memory[0]) + 2 * state_bytes + sys.getsizeof(memory[0][1]) + 3 * 28)
+    buffer_bytes = buffer.nbytes
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        s, a, r, s2, d = zip(*random.sample(memory, batch_size))
+        torch.tensor(np.array(s), dtype=torch.float), torch.tensor(np.array(a), dtype=torch.long)
+        torch.tensor(np.array(r), dtype=torch.float), torch.tensor(np.array(s2), dtype=torch.float)
+        torch.tensor(np.array(d), dtype=torch.bool)
+    deque_time = (time.perf_counter() - start) / repeats
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        s, a, r, s2, d = buffer.sample(batch_size)
+        s.float(), a.long(), r.float(), s2.float(), d.bool()
+    buffer_time = (time.perf_counter() - start) / repeats
+
+    return {
+        'capacity': capacity,
+        'batch_size': batch_size,
+        'deque_mb': deque_bytes / 2 ** 20,
+        'buffer_mb': buffer_bytes / 2 ** 20,
+        'deque_sample_ms': deque_time * 1000,
+        'buffer_sample_ms': buffer_time * 1000,
+    }
+
+
+# Replay memory configurations verified by --check: feed, n_step, frame_stack, capacity, prioritized.
+# 'append' plays one game through ReplayBuffer.append, 'extend' one game in batches of 1 to 7 moves,
+# 'streams' 8 interleaved games in batches of 1 to 3 steps, and 'chunks' two actors sending
+# alternate chunks, as in ai.distributed (which rejects frame stacking).
+REPLAY_CHECKS = [
+    *((feed, n_step, frame_stack, 10_000, False) for feed in ('append', 'extend', 'streams')
+      for n_step, frame_stack in ((1, 1), (3, 1), (1, 4), (3, 4))),
+    *((feed, 3, 4, 50, False) for feed in ('append', 'extend', 'streams')),
+    *((feed, 3, 4, 10_000, True) for feed in ('append', 'extend', 'streams')),
+    ('chunks', 1, 1, 10_000, False), ('chunks', 3, 1, 10_000, False), ('chunks', 3, 1, 50, False),
+    ('chunks', 3, 1, 10_000, True),
+]
+
+
+class _ReferenceGames:
+    """
+    Synthetic games of unique random 11 byte frames, with every frame, reward and done
+    kept, from which check_replay rebuilds what each replay slot should hold.
+    """
+    def __init__(self, players, rng):
+        self.rng = rng
+        self.games = []
+        self.where = {}  # frame bytes -> (game, move)
+        self.current = [self._new_game() for _ in range(players)]
+
+    def _new_game(self):
+        game = {'frames': [self.rng.integers(0, 256, 11, dtype=np.uint8)], 'rewards': [], 'dones': []}
+        self.games.append(game)
+        return game
+
+    def move(self, player):
+        """Plays one move of a player's game and returns (state, reward, next_state, done)."""
+        game = self.current[player]
+        t = len(game['rewards'])
+        done = bool(self.rng.random() < 0.1)
+        game['rewards'].append(float(self.rng.integers(-10, 11)))
+        game['dones'].append(done)
+        game['frames'].append(self.rng.integers(0, 256, 11, dtype=np.uint8))
+        self.where[game['frames'][t].tobytes()] = (game, t)
+        if done:
+            self.current[player] = self._new_game()
+        return game['frames'][t], game['rewards'][t], game['frames'][t + 1], done
+
+    @staticmethod
+    def stacked(game, t, frame_stack):
+        """The last frame_stack frames of a game up to move t, zeros before its start."""
+        return np.concatenate([game['frames'][i] if i >= 0 else np.zeros(11, dtype=np.uint8)
+                               for i in range(t - frame_stack + 1, t + 1)])
+
+    @staticmethod
+    def returns(game, t, n_step, gamma):
+        """The n-step return of move t, the move it bootstraps from (None at a game end) and done."""
+        ret, discount = 0.0, 1.0
+        for j in range(n_step):
+            ret += discount * game['rewards'][t + j]
+            discount *= gamma
+            if game['dones'][t + j]:
+                return ret, None, True
+        return ret, t + n_step, False
+
+    def complete(self, n_step):
+        """The number of moves whose n-step window has been played, up to the following state."""
+        count = 0
+        for game in self.games:
+            played = len(game['rewards'])
+            for t in range(played):
+                ends = [j for j in range(n_step) if t + j < played and game['dones'][t + j]]
+                count += t + (ends[0] if ends else n_step) + 1 <= played
+        return count
+
+
+def check_replay(steps=600, seed=0, cases=REPLAY_CHECKS):
+    """
+    Checks ReplayBuffer and PrioritizedReplayBuffer against a naive reference. Synthetic
+    games are fed to the memory; every valid slot's stacked state, n-step return, next
+    state and done must then equal the ones rebuilt from the games' full histories, the
+    number of valid slots must match while the ring has not wrapped, and a copy restored
+    from state_dict must hold and sample the same.
+
+    Returns:
+    --------
+    list
+        One message per failed check, empty when the memory is correct.
+    """
+    failures = []
+    for feed, n_step, frame_stack, capacity, prioritized in cases:
+        name = f'{feed} n_step={n_step} frame_stack={frame_stack} capacity={capacity} prioritized={prioritized}'
+        rng = np.random.default_rng(seed)
+        streams = 8 if feed == 'streams' else 1
+        reference = _ReferenceGames(2 if feed == 'chunks' else streams, rng)
+        replay = PrioritizedReplayBuffer if prioritized else ReplayBuffer
+        args = (capacity, (11,))
+        kwargs = dict(seed=seed, n_step=n_step, gamma=0.9, frame_stack=frame_stack, streams=streams)
+        memory = replay(*args, **kwargs)
+
+        def extend(rows):
+            states, rewards, next_states, dones = (np.array(column) for column in zip(*rows))
+            memory.extend(states, rng.integers(0, 3, len(rows)), rewards, next_states, dones)
+
+        if feed == 'append':
+            for _ in range(steps):
+                state, reward, next_state, done = reference.move(0)
+                memory.append(state, int(rng.integers(3)), reward, next_state, done)
+        elif feed == 'extend':
+            fed = 0
+            while fed < steps:
+                size = fed % 7 + 1
+                extend([reference.move(0) for _ in range(size)])
+                fed += size
+        elif feed == 'streams':
+            fed = 0
+            while fed < steps // streams:
+                size = fed % 3 + 1
+                extend([reference.move(player) for _ in range(size) for player in range(streams)])
+                fed += size
+        else:
+            for chunk in range(steps // 5):
+                extend([reference.move(chunk % 2) for _ in range(5)])
+
+        idx = np.arange(memory.size)
+        valid = memory._valid(idx)
+        states, _, returns, next_states, dones = (x.numpy() for x in memory.get(idx[valid]))
+        wrong = 0
+        for state, ret, next_state, done in zip(states, returns, next_states, dones):
+            try:
+                game, t = reference.where[state[-11:].tobytes()]
+                expected, next_t, expected_done = reference.returns(game, t, n_step, 0.9)
+            except (KeyError, IndexError):  # not a stored move, or one whose window was not played
+                wrong += 1
+                continue
+            ok = (np.isclose(ret, expected, atol=1e-4) and bool(done) == expected_done
+                  and (state == reference.stacked(game, t, frame_stack)).all())
+            if next_t is not None:
+                ok = ok and (next_state == reference.stacked(game, next_t, frame_stack)).all()
+            wrong += not ok
+        if wrong:
+            failures.append(f'{name}: {wrong} of {len(states)} valid slots differ from the reference')
+        if feed != 'chunks' and memory.total <= capacity and valid.sum() != reference.complete(n_step):
+            failures.append(f'{name}: {valid.sum()} valid slots, expected {reference.complete(n_step)}')
+
+        restored = replay(*args, **kwargs)
+        restored.load_state_dict(memory.state_dict())
+        same = all((a == b).all() for a, b in zip(memory.get(idx), restored.get(idx)))
+        same = same and (restored._valid(idx) == valid).all()
+        same = same and (memory.sample_indices(64) == restored.sample_indices(64)).all()
+        if not same:
+            failures.append(f'{name}: differs after state_dict and load_state_dict')
+
+    return failures
+
+
+def games_to_mean_score(prioritized=PRIORITIZED_REPLAY, target=TARGET_MEAN_SCORE, window=100, max_games=1000, seed=0,
+                        **schedule):
+    """
+    Trains a fresh agent headless, without plotting, until the mean score of its last
+    `window` games reaches `target`.
+
+    Parameters:
+    -----------
+    prioritized : bool
+        Whether the agent uses prioritized replay.
+    target : float
+        The mean score to reach.
+    window : int
+        The number of most recent games the mean is taken over.
+    max_games : int
+        Gives up after this many games.
+    seed : int
+        Seed for Python, NumPy and torch.
+    **schedule :
+        Training schedule and target network arguments of Agent, e.g. train_every=4.
+
+    Returns:
+    --------
+    dict
+        The games played (None if the target was not reached), steps and wall time.
+    """
+    seed_everything(seed)
+    agent = Agent(prioritized=prioritized, **schedule)
+    agent.memory.rng = np.random.default_rng(seed)
+    game = SnakeGameAI(headless=True)
+    scores = deque(maxlen=window)
+    steps = 0
+    reached = None
+    start = time.perf_counter()
+
+    while agent.n_games < max_games:
+        state_old = agent.get_state(game)
+        final_move = agent.get_action(state_old)
+        reward, done, score = game.play_step(final_move)
+        state_new = agent.get_state(game)
+        agent.learn(state_old, final_move, reward, state_new, done)
+        steps += 1
+
+        if done:
+            game.reset()
+            agent.n_games += 1
+            agent.train_long_memory()
+            scores.append(score)
+            if len(scores) == window and sum(scores) / window >= target:
+                reached = agent.n_games
+                break
+
+    return {
+        'prioritized': prioritized,
+        'target': target,
+        'games': reached,
+        'steps': steps,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def hamiltonian_cycle(cols, rows):
+    """
+    Returns the cells (x, y) of a cycle visiting every cell of the board once: along the
+    top row, back and forth over the remaining rows and up the first column.
+    A snake following it never dies, whatever its length. Needs an even number of rows.
+    """
+    assert rows % 2 == 0, 'the cycle needs an even number of rows'
+    cycle = [(x, 0) for x in range(cols)]
+    for y in range(1, rows):
+        xs = range(cols - 1, 0, -1) if y % 2 else range(1, cols)
+        cycle.extend((x, y) for x in xs)
+    cycle.extend((0, y) for y in range(rows - 1, 0, -1))
+    return cycle
+
+
+def cycle_game(length, cols=COLS, rows=ROWS):
+    """
+    Returns a headless SnakeGameAI of cols x rows cells whose snake has the given length
+    and lies along the Hamiltonian cycle, and the one-hot action to play at every cell to
+    keep following it.
+
+    Returns:
+    --------
+    tuple
+        The game and a dict mapping each cell (x, y) to its action.
+    """
+    game = SnakeGameAI(True, cols, rows)
+    cycle = hamiltonian_cycle(cols, rows)
+    n = len(cycle)
+    # Direction of the move leaving each cell of the cycle
+    leave = [CLOCK_WISE[MOVES.index(((cycle[(i + 1) % n][0] - x), (cycle[(i + 1) % n][1] - y)))]
+             for i, (x, y) in enumerate(cycle)]
+    actions = {}
+    for i, cell in enumerate(cycle):
+        turn = (CLOCK_WISE.index(leave[i]) - CLOCK_WISE.index(leave[i - 1])) % 4
+        actions[cell] = [[1, 0, 0], [0, 1, 0], None, [0, 0, 1]][turn]
+
+    head = length - 1
+    game.snake = deque(Point(x, y) for x, y in reversed(cycle[:length]))
+    game.head = game.snake[0]
+    game.direction = leave[head - 1]
+    game.board.clear()
+    for pt in game.snake:
+        game.board.add(pt)
+    game._place_food()
+    return game, actions
+
+
+def bench_env_steps(lengths=(3, 50, 200, 500), steps=5000, seed=0):
+    """
+    Measures SnakeGameAI.play_step (headless) steps/sec for snakes of several lengths.
+    The snake follows a Hamiltonian cycle so it never dies; it may grow a little by eating.
+    """
+    results = []
+    for length in lengths:
+        seed_everything(seed)
+        game, actions = cycle_game(length)
+        elapsed = 0.0
+        for _ in range(steps):
+            action = actions[game.head]
+            start = time.perf_counter()
+            game.play_step(action)
+            elapsed += time.perf_counter() - start
+            game.frame_iteration = 0
+        results.append({'length': length, 'steps_per_sec': steps / elapsed})
+    return results
+
+
+def bench_board_sizes(sizes=((10, 10), (20, 20), (32, 24), (50, 50), (100, 100), (200, 200)),
+                      steps=2000, num_envs=64, seed=0):
+    """
+    Measures how the board size affects SnakeGameAI.play_step steps/sec (a 50 cell snake
+    on the Hamiltonian cycle), VectorSnakeEnv env-steps/sec and the memory each game holds:
+    the Board of one SnakeGameAI and the per-game arrays of a VectorSnakeEnv. The Board is
+    measured with tracemalloc when empty, its largest, so the int objects its free and slot
+    lists point to are counted along with the lists.
+    """
+    results = []
+    for cols, rows in sizes:
+        seed_everything(seed)
+        game, actions = cycle_game(min(50, cols * rows // 2), cols, rows)
+        start = time.perf_counter()
+        for _ in range(steps):
+            game.play_step(actions[game.head])
+            game.frame_iteration = 0
+        game_rate = steps / (time.perf_counter() - start)
+        tracemalloc.start()
+        board = Board(cols, rows)
+        board_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        env = VectorSnakeEnv(num_envs, cols, rows, seed=seed)
+        env_actions = np.random.default_rng(seed).integers(0, 3, size=(steps // 10, num_envs))
+        states = env.observe()
+        start = time.perf_counter()
+        for a in env_actions:
+            env.step(a)
+            env.observe(out=states)
+        env_rate = len(env_actions) * num_envs / (time.perf_counter() - start)
+        env_bytes = sum(a.nbytes for a in (env.heads, env.directions, env.grid, env.body, env.head_ptr,
+                                           env.lengths, env.food, env.scores, env.frames)) // num_envs
+
+        results.append({'board': f'{cols}x{rows}', 'game_steps_per_sec': game_rate,
+                        'vector_env_steps_per_sec': env_rate,
+                        'board_bytes': board_bytes, 'vector_env_bytes': env_bytes})
+    return results
+
+
+def bench_render(lengths=(3, 50, 200, 500), frames=300, seed=0):
+    """
+    Measures SnakeGameAI drawing frames/sec with the incremental Renderer and with a full
+    redraw every frame, for snakes of several lengths on the Hamiltonian cycle. Uses SDL's
+    dummy video driver unless another one is set, so it times the drawing, not the screen.
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    results = []
+    for length in lengths:
+        row = {'length': length}
+        for mode in ('full', 'incremental'):
+            seed_everything(seed)
+            game, actions = cycle_game(length)
+            game._init_display()
+            elapsed = 0.0
+            for _ in range(frames):
+                game.play_step(actions[game.head])
+                if mode == 'full':
+                    game.renderer.invalidate()
+                start = time.perf_counter()
+                game.renderer.draw(game)
+                elapsed += time.perf_counter() - start
+            row[f'{mode}_frames_per_sec'] = frames / elapsed
+        results.append(row)
+    return results
+
+
+def bench_observations(observations=('features', 'grid', 'grid_age'), repeats=2000, batch_size=256,
+                       num_envs=256, seed=0):
+    """
+    Measures the per-step cost of each observation mode on the default board: encoding a
+    single game (Agent.get_state), a greedy action (Agent.get_action), encoding a
+    VectorSnakeEnv, training samples/sec of Agent.train_long_memory, and the bytes
+    preallocated by its replay memory.
+    """
+    results = []
+    for observation in observations:
+        seed_everything(seed)
+        agent = Agent(observation=observation)
+        agent.n_games = 1000  # greedy actions only
+        game, _ = cycle_game(50)
+        row = {'observation': observation}
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            state = agent.get_state(game)
+        row['states_per_sec'] = repeats / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            agent.get_action(state)
+        row['actions_per_sec'] = repeats / (time.perf_counter() - start)
+
+        env = VectorSnakeEnv(num_envs, seed=seed)
+        states = np.empty((num_envs, *agent.encoder.shape), dtype=np.uint8)
+        start = time.perf_counter()
+        for _ in range(max(1, repeats // 100)):
+            agent.encoder.encode_batch(env, out=states)
+        row['batch_states_per_sec'] = max(1, repeats // 100) * num_envs / (time.perf_counter() - start)
+
+        rng = np.random.default_rng(seed)
+        n = 4 * batch_size
+        images = (rng.random((n + 1, *agent.encoder.shape)) < 0.1).astype(np.uint8) * 255
+        agent.memory.extend(images[:-1], rng.integers(0, 3, n), rng.choice([-10.0, 0.0, 10.0], n), images[1:],
+                            rng.random(n) < 0.1)
+        agent.train_long_memory(batch_size)  # warm-up
+        train_repeats = max(2, repeats // 200)
+        start = time.perf_counter()
+        for _ in range(train_repeats):
+            agent.train_long_memory(batch_size)
+        row['train_samples_per_sec'] = train_repeats * batch_size / (time.perf_counter() - start)
+        row['replay_bytes'] = agent.memory.nbytes
+        results.append(row)
+    return results
+
+
+def bench_get_state(lengths=(3, 50, 200, 500), repeats=20000, seed=0):
+    """
+    Measures Agent.get_state states/sec for snakes of several lengths.
+    """
+    agent = Agent()
+    results = []
+    for length in lengths:
+        seed_everything(seed)
+        game, _ = cycle_game(length)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            agent.get_state(game)
+        results.append({'length': length, 'states_per_sec': repeats / (time.perf_counter() - start)})
+    return results
+
+
+def bench_vector_env(num_envs=(1, 64, 1024), steps=200, seed=0):
+    """
+    Measures VectorSnakeEnv env-steps/sec (step plus observe) for several numbers of games.
+    """
+    results = []
+    for k in num_envs:
+        env = VectorSnakeEnv(k, seed=seed)
+        rng = np.random.default_rng(seed)
+        actions = rng.integers(0, 3, size=(steps, k))
+        states = env.observe()
+        start = time.perf_counter()
+        for t in range(steps):
+            env.step(actions[t])
+            env.observe(out=states)
+        results.append({'num_envs': k, 'steps_per_sec': steps * k / (time.perf_counter() - start)})
+    return results
+
+
+def bench_train_long_memory(batch_sizes=(32, 256, 1000, 4096), repeats=20, seed=0):
+    """
+    Measures training samples/sec of Agent.train_long_memory, i.e. replay sampling plus
+    QTrainer.train_batch, for several batch sizes on a full replay memory.
+    """
+    results = []
+    for batch_size in batch_sizes:
+        seed_everything(seed)
+        agent = Agent()
+        agent.memory.rng = np.random.default_rng(seed)
+        rng = np.random.default_rng(seed)
+        states, actions, rewards, next_states, dones = random_batch(MAX_MEMORY, rng)
+        agent.memory.extend(states, actions.argmax(axis=1), rewards, next_states, dones)
+        agent.train_long_memory(batch_size)  # warm-up
+        start = time.perf_counter()
+        for _ in range(repeats):
+            agent.train_long_memory(batch_size)
+        elapsed = time.perf_counter() - start
+        results.append({'batch_size': batch_size, 'samples_per_sec': repeats * batch_size / elapsed})
+    return results
+
+
+def bench_updates(batch_sizes=(1, 64), repeats=500, seed=0):
+    """
+    Measures calls/sec of the small-batch hot paths, where the cost of each call rather
+    than its arithmetic dominates: QTrainer.train_step on one move and on a batch, and
+    greedy Agent.get_action and Agent.get_actions.
+    """
+    seed_everything(seed)
+    agent = Agent()
+    agent.n_games = 1000  # greedy actions only
+    rng = np.random.default_rng(seed)
+    results = []
+    for batch_size in batch_sizes:
+        states, actions, rewards, next_states, dones = random_batch(batch_size, rng)
+        if batch_size == 1:
+            batch = (states[0], actions[0], rewards[0], next_states[0], dones[0])
+            calls = (('train_step', agent.trainer.train_step, batch), ('get_action', agent.get_action, (states[0],)))
+        else:
+            batch = (states, actions, rewards, next_states, dones)
+            calls = (('train_step', agent.trainer.train_step, batch), ('get_actions', agent.get_actions, (states,)))
+        for name, call, args in calls:
+            call(*args)  # warm-up
+            start = time.perf_counter()
+            for _ in range(repeats):
+                call(*args)
+            results.append({'call': name, 'batch_size': batch_size,
+                            'calls_per_sec': repeats / (time.perf_counter() - start)})
+    return results
+
+
+def bench_inference(batch_sizes=(1, 64, 4096), states=20000, seed=0):
+    """
+    Measures greedy action calls/sec and states/sec of the inference backends: the float32
+    Linear_QNet, its int8 dynamic quantization and the fused NumPy kernel of
+    ai.runtime.MLPPolicy. A batch size of 1 passes a single state, as a game does on each
+    move. Each backend's agreement is the share of float32 actions it picks on the largest
+    batch.
+    """
+    seed_everything(seed)
+    model = Linear_QNet(11, 256, 3).eval()
+    policy = MLPPolicy.from_model(model)
+
+    def torch_actions(net):
+        def act(x):
+            with torch.inference_mode():
+                return torch.argmax(net(torch.from_numpy(np.atleast_2d(x))), dim=1).numpy()  # int8 layers need a batch
+        return act
+
+    backends = (('torch', torch_actions(model)), ('int8', torch_actions(quantize(model))),
+                ('numpy', lambda x: policy.act(x) if x.ndim == 1 else policy.act_batch(x)))
+    batch = np.random.default_rng(seed).integers(0, 2, (max(batch_sizes), 11)).astype(np.float32)
+    reference = backends[0][1](batch)
+    results = []
+    for name, act in backends:
+        agreement = float(np.mean(act(batch) == reference))
+        for batch_size in batch_sizes:
+            x = batch[0] if batch_size == 1 else batch[:batch_size]
+            repeats = max(20, states // batch_size)
+            act(x)  # warm-up
+            start = time.perf_counter()
+            for _ in range(repeats):
+                act(x)
+            calls_per_sec = repeats / (time.perf_counter() - start)
+            results.append({'backend': name, 'batch_size': batch_size, 'calls_per_sec': calls_per_sec,
+                            'states_per_sec': calls_per_sec * batch_size, 'agreement': agreement})
+    return results
+
+
+def bench_end_to_end(seconds=10.0, seed=0):
+    """
+    Runs the train() loop headless, without plotting or metrics, for a fixed time and
+    reports the games/sec and steps/sec it sustains.
+    """
+    seed_everything(seed)
+    agent = Agent()
+    agent.memory.rng = np.random.default_rng(seed)
+    game = SnakeGameAI(headless=True)
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        state_old = agent.get_state(game)
+        final_move = agent.get_action(state_old)
+        reward, done, score = game.play_step(final_move)
+        state_new = agent.get_state(game)
+        agent.learn(state_old, final_move, reward, state_new, done)
+        steps += 1
+        if done:
+            game.reset()
+            agent.n_games += 1
+            agent.train_long_memory()
+    elapsed = time.perf_counter() - start
+    return {'games_per_sec': agent.n_games / elapsed, 'steps_per_sec': steps / elapsed}
+
+
+def bench_imports(budgets=IMPORT_BUDGETS, repeats=3):
+    """
+    Measures the cold import time of each entry point module in a fresh interpreter
+    (best of `repeats`) and which heavy dependencies it loads, against its budget.
+    """
+    code = ('import sys, time; start = time.perf_counter(); import {}; '
+            'print(time.perf_counter() - start); '
+            'print(",".join(m for m in ("pygame", "numpy", "torch", "matplotlib") if m in sys.modules))')
+    results = []
+    for module, budget in budgets.items():
+        seconds = float('inf')
+        for _ in range(repeats):
+            out = subprocess.run([sys.executable, '-c', code.format(module)], cwd=CURRENT_DIR,
+                                 capture_output=True, text=True, check=True,
+                                 env=dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT='1')).stdout.split('\n')
+            seconds = min(seconds, float(out[0]))
+        results.append({'module': module, 'import_seconds': seconds, 'budget_seconds': budget,
+                        'loads': out[1], 'over_budget': seconds > budget})
+    return results
+
+
+def git_commit():
+    """
+    Returns the current git commit of the repository, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=CURRENT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(output=None, quick=False, seed=0, threads=1):
+    """
+    Runs every throughput benchmark with fixed seeds and writes the results as JSON.
+
+    Parameters:
+    -----------
+    output : str, optional
+        The JSON file to write. Defaults to ai/logs/bench-<commit>.json.
+    quick : bool
+        Uses fewer repeats, for a fast smoke run.
+    seed : int
+        The seed every benchmark starts from.
+    threads : int
+        The torch intra-op threads, 1 by default so runs compare across machines.
+
+    Returns:
+    --------
+    dict
+        The results, as written to the file.
+    """
+    set_threads(threads)
+    scale = 0.1 if quick else 1.0
+    results = {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'threads': torch.get_num_threads(),
+        'seed': seed,
+        'env_steps': bench_env_steps(steps=int(5000 * scale), seed=seed),
+        'get_state': bench_get_state(repeats=int(20000 * scale), seed=seed),
+        'vector_env': bench_vector_env(steps=int(200 * scale), seed=seed),
+        'board_sizes': bench_board_sizes(steps=int(2000 * scale), seed=seed),
+        'render': bench_render(frames=int(300 * scale), seed=seed),
+        'observations': bench_observations(repeats=int(2000 * scale), seed=seed),
+        'imports': bench_imports(repeats=1 if quick else 3),
+        'train_long_memory': bench_train_long_memory(repeats=max(2, int(20 * scale)), seed=seed),
+        'updates': bench_updates(repeats=int(500 * scale), seed=seed),
+        'inference': bench_inference(states=int(20000 * scale), seed=seed),
+        'end_to_end': bench_end_to_end(seconds=10.0 * scale, seed=seed),
+    }
+    if output is None:
+        output = os.path.join(AI, 'logs', 'bench-{}.json'.format(results['commit'] or 'local'))
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print_results(results)
+    print('Results written to', output)
+    return results
+
+
+def _rates(results):
+    """
+    Flattens a results dict into {'section[key=value].metric': rate} for comparison.
+    """
+    rates = {}
+    for section, rows in results.items():
+        if isinstance(rows, dict):
+            rows = [rows]
+        if not isinstance(rows, list):
+            continue
+        for row in rows:
+            keys = ','.join(f'{k}={v}' for k, v in row.items() if not k.endswith(('_per_sec', '_bytes', 'agreement')))
+            for k, v in row.items():
+                if k.endswith('_per_sec'):
+                    rates[f'{section}[{keys}].{k}'] = v
+    return rates
+
+
+def print_results(results):
+    """
+    Prints every rate of a results dict.
+    """
+    for name, rate in _rates(results).items():
+        print(f'{name:<60} {rate:>14,.0f}')
+    for row in results.get('board_sizes', []):
+        print(f"board_sizes[board={row['board']}] bytes per game: Board {row['board_bytes']:,}, "
+              f"VectorSnakeEnv {row['vector_env_bytes']:,}")
+    print_imports(results.get('imports', []))
+
+
+def print_imports(rows):
+    """
+    Prints the import times measured by bench_imports.
+    """
+    for row in rows:
+        flag = '  OVER BUDGET' if row['over_budget'] else ''
+        print(f"import {row['module']:<20} {row['import_seconds']:6.3f} s  (budget {row['budget_seconds']:.2f} s)  "
+              f"loads: {row['loads'] or '-'}{flag}")
+
+
+def compare(baseline_path, candidate_path, tolerance=0.1):
+    """
+    Compares two result files and reports every rate that dropped by more than `tolerance`.
+
+    Returns:
+    --------
+    list
+        The names of the regressed rates.
+    """
+    with open(baseline_path) as f:
+        baseline = _rates(json.load(f))
+    with open(candidate_path) as f:
+        candidate = _rates(json.load(f))
+    regressions = []
+    for name, old in baseline.items():
+        if name not in candidate:
+            continue
+        ratio = candidate[name] / old
+        flag = ''
+        if ratio < 1.0 - tolerance:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:<60} {old:>14,.0f} -> {candidate[name]:>14,.0f}  {ratio:6.2f}x{flag}')
+    return regressions
+
+
+def main(argv=None):
+    """
+    Command line entry point, see python -m ai.benchmark --help.
+    """
+    parser = argparse.ArgumentParser(prog='python -m ai.benchmark', description='Snake-Intelligence benchmarks')
+    parser.add_argument('--output', help='JSON file for the suite results (default ai/logs/bench-<commit>.json)')
+    parser.add_argument('--quick', action='store_true', help='fewer repeats, for a fast smoke run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threads', type=int, default=1, help='torch intra-op threads for the suite')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'),
+                        help='compare two result files and exit non-zero on a regression')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed slowdown for --compare')
+    parser.add_argument('--train-step', action='store_true', help='loop vs vectorized QTrainer.train_step')
+    parser.add_argument('--replay', action='store_true', help='tuple deque vs ReplayBuffer memory and sampling')
+    parser.add_argument('--replay-modes', action='store_true', help='games to a target mean score, uniform vs prioritized')
+    parser.add_argument('--schedules', action='store_true', help='games and wall time to a target mean score per training schedule')
+    parser.add_argument('--observations', action='store_true',
+                        help='games and wall time to a target mean score per observation mode')
+    parser.add_argument('--imports', action='store_true', help='entry point import times, non-zero exit over budget')
+    parser.add_argument('--check', action='store_true',
+                        help='check the replay memory against a naive reference, non-zero exit on a mismatch')
+    parser.add_argument('--inference', action='store_true',
+                        help='action latency, throughput and agreement of the float32, int8 and NumPy backends')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare(*args.compare, tolerance=args.tolerance) else 0
+    if args.check:
+        failures = check_replay(seed=args.seed)
+        for failure in failures:
+            print('FAIL', failure)
+        print(f'replay memory: {len(REPLAY_CHECKS)} configurations checked, {len(failures)} failures')
+        return 1 if failures else 0
+    if args.imports:
+        rows = bench_imports()
+        print_imports(rows)
+        return 1 if any(row['over_budget'] for row in rows) else 0
+    if args.train_step:
+        for row in bench_train_step(seed=args.seed):
+            print('batch {batch_size:>5}: loop {loop_ms:8.2f} ms  vectorized {vectorized_ms:7.2f} ms  '
+                  'speedup {speedup:6.1f}x  max param diff {max_param_diff:.2e}'.format(**row))
+    if args.replay:
+        print('replay: deque {deque_mb:.1f} MB, {deque_sample_ms:.2f} ms/batch  '
+              'buffer {buffer_mb:.1f} MB, {buffer_sample_ms:.2f} ms/batch'.format(**bench_replay_sampling(seed=args.seed)))
+    if args.replay_modes:
+        for prioritized in (False, True):
+            print('prioritized={prioritized}: target mean {target} reached after {games} games '
+                  '({steps} steps, {seconds:.0f} s)'.format(**games_to_mean_score(prioritized, seed=args.seed)))
+    if args.schedules:
+        for name, schedule in SCHEDULES:
+            print('{name}: target mean {target} reached after {games} games ({steps} steps, {seconds:.0f} s)'.format(
+                name=name, **games_to_mean_score(seed=args.seed, **schedule)))
+    if args.observations:
+        # per-move updates of the convolutional network are too slow to compare, so all use batches
+        schedule = dict(SCHEDULES)['batch every 4, hard target sync 250']
+        for observation in ('features', 'grid', 'grid_age'):
+            print('{observation}: target mean {target} reached after {games} games ({steps} steps, {seconds:.0f} s)'.format(
+                observation=observation, **games_to_mean_score(seed=args.seed, observation=observation, **schedule)))
+    if args.inference:
+        set_threads(args.threads)
+        for row in bench_inference(seed=args.seed):
+            print('{backend:<6} batch {batch_size:>5}: {latency:9.1f} us/call  {states_per_sec:12,.0f} states/sec  '
+                  'agreement {agreement:.2%}'.format(latency=1e6 / row['calls_per_sec'], **row))
+    if not (args.train_step or args.replay or args.replay_modes or args.schedules or args.observations or args.inference):
+        run_suite(args.output, args.quick, args.seed, args.threads)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+from settings import *
+import copy
+import glob
+import shutil
+import threading
+import numpy as np
+import torch
+
+
+def seed_everything(seed):
+    """
+    Seeds Python, NumPy and torch so a run can be replayed exactly.
+
+    Parameters:
+    -----------
+    seed : int
+        The seed.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def rng_states():
+    """
+    Returns the states of the Python, NumPy and torch random generators.
+    """
+    return {'python': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()}
+
+
+def set_rng_states(states):
+    """
+    Restores the random generator states returned by rng_states.
+    """
+    random.setstate(states['python'])
+    np.random.set_state(states['numpy'])
+    torch.set_rng_state(states['torch'])
+
+
+class Checkpointer:
+    """
+    Saves and restores a whole training run: model, target network, QTrainer Adam
+    state, replay memory, game and step counts, random generator states and the
+    caller's score history.
+
+    save() takes a consistent in-memory copy of everything and hands it to a background
+    thread that writes it, so training only pays for the copy. Each checkpoint is a
+    directory ckpt-<games> holding train.pt (torch objects) and memory.npz (the replay
+    memory, compressed); it is written under a temporary name and renamed when complete,
+    so a run preempted mid-write still has its previous checkpoint.
+
+    Attributes:
+    -----------
+    directory : str
+        Where checkpoints are written.
+    every : int
+        maybe_save() saves every this many games.
+    keep : int
+        The number of most recent checkpoints kept on disk.
+
+    Methods:
+    --------
+    maybe_save(agent, **extra):
+        Saves when the game count is a multiple of `every`.
+    save(agent, **extra):
+        Starts writing a checkpoint in the background.
+    wait():
+        Blocks until the pending write has finished.
+    latest():
+        Returns the path of the newest complete checkpoint.
+    load(agent, path=None):
+        Restores a checkpoint into the agent and returns the extra values saved with it.
+    """
+    def __init__(self, directory=CHECKPOINT_DIR, every=CHECKPOINT_EVERY, keep=CHECKPOINT_KEEP):
+        self.directory = directory
+        self.every = every
+        self.keep = keep
+        self._thread = None
+
+    def maybe_save(self, agent, **extra):
+        """
+        Saves a checkpoint when agent.n_games is a multiple of `every`.
+        """
+        if self.every and agent.n_games % self.every == 0:
+            self.save(agent, **extra)
+
+    def save(self, agent, **extra):
+        """
+        Copies the training state and writes it from a background thread.
+
+        Parameters:
+        -----------
+        agent : Agent
+            The agent whose model, trainer and memory are saved.
+        **extra :
+            Picklable values saved alongside, e.g. record and total_score.
+        """
+        trainer = agent.trainer
+        state = {
+            'n_games': agent.n_games,
+            'n_steps': agent.n_steps,
+            'model': copy.deepcopy(agent.model.state_dict()),
+            'target': copy.deepcopy(trainer.target_model.state_dict()) if trainer.target_model is not None else None,
+            'updates': trainer.updates,
+            'optimizer': copy.deepcopy(trainer.optimizer.state_dict()),
+            'rng': rng_states(),
+            'extra': copy.deepcopy(extra),
+        }
+        memory = agent.memory.state_dict()
+        self.wait()  # at most one write in flight
+        self._thread = threading.Thread(target=self._write, args=(state, memory), name='checkpoint-writer')
+        self._thread.start()
+
+    def wait(self):
+        """
+        Blocks until the pending write, if any, has finished.
+        """
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _write(self, state, memory):
+        """
+        Writes one checkpoint atomically and prunes the old ones.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, 'ckpt-{:08d}'.format(state['n_games']))
+        tmp = path + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        torch.save(state, os.path.join(tmp, 'train.pt'))
+        np.savez_compressed(os.path.join(tmp, 'memory.npz'), **memory)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp, path)
+        for old in self._checkpoints()[:-self.keep]:
+            shutil.rmtree(old, ignore_errors=True)
+
+    def _checkpoints(self):
+        """
+        Returns the complete checkpoints, oldest first. Only directories count, so other
+        files named like them are ignored.
+        """
+        return sorted(p for p in glob.glob(os.path.join(self.directory, 'ckpt-*'))
+                      if not p.endswith('.tmp') and os.path.isdir(p))
+
+    def latest(self):
+        """
+        Returns the path of the newest complete checkpoint, or None if there is none.
+        """
+        checkpoints = self._checkpoints()
+        return checkpoints[-1] if checkpoints else None
+
+    def load(self, agent, path=None):
+        """
+        Restores a checkpoint into the agent, including the global random generator states.
+
+        Parameters:
+        -----------
+        agent : Agent
+            An agent built with the same settings as the one that was saved.
+        path : str, optional
+            The checkpoint directory. Defaults to the newest one.
+
+        Returns:
+        --------
+        dict
+            The extra values passed to save, or None when there is no checkpoint.
+        """
+        path = path or self.latest()
+        if path is None:
+            return None
+        state = torch.load(os.path.join(path, 'train.pt'), map_location='cpu', weights_only=False)
+        agent.n_games = state['n_games']
+        agent.n_steps = state.get('n_steps', 0)
+        agent.model.load_state_dict(state['model'])
+        agent.trainer.updates = state.get('updates', 0)
+        if agent.trainer.target_model is not None:
+            agent.trainer.target_model.load_state_dict(state.get('target') or state['model'])
+        agent.trainer.optimizer.load_state_dict(state['optimizer'])
+        with np.load(os.path.join(path, 'memory.npz')) as memory:
+            agent.memory.load_state_dict(dict(memory))
+        set_rng_states(state['rng'])
+        return state['extra']
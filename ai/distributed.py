@@ -0,0 +1,200 @@
+from settings import *
+from .agent import Agent, epsilon_greedy
+from .model import InputBuffers, model_from_state_dict
+from .state import make_encoder
+from .snake_ai import SnakeGameAI
+from .metrics import MetricsWriter
+import copy
+import queue
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+
+def actor(actor_id, shared_model, lock, version, n_games, transitions, stop, chunk_size, sync_steps, seed):
+    """
+    Plays headless games with a local copy of the shared model and streams the
+    transitions to the learner in chunks.
+
+    Parameters:
+    -----------
+    actor_id : int
+        The index of this actor, used to offset the seed.
+    shared_model : Linear_QNet or Conv_QNet
+        The model in shared memory the learner publishes its weights to.
+    lock : multiprocessing.Lock
+        Guards shared_model while it is being written or copied.
+    version : multiprocessing.Value
+        Incremented by the learner each time it publishes new weights.
+    n_games : multiprocessing.Value
+        The number of games played by all actors, which drives the exploration rate.
+    transitions : multiprocessing.Queue
+        Receives (states, actions, rewards, next_states, dones, scores) chunks.
+    stop : multiprocessing.Event
+        Set by the learner to end the actor.
+    chunk_size : int
+        The number of transitions sent per chunk.
+    sync_steps : int
+        How many moves are played between checks for new weights.
+    seed : int
+        The base seed of the run.
+    """
+    torch.set_num_threads(1)
+    random.seed(seed + actor_id)
+    np.random.seed(seed + actor_id)
+    torch.manual_seed(seed + actor_id)
+
+    # Only what acting needs: no replay memory or optimizer
+    encoder = make_encoder()
+    inputs = InputBuffers()
+    with lock:
+        model = model_from_state_dict(shared_model.state_dict())
+        local_version = version.value
+    game = SnakeGameAI(headless=True)
+
+    states = np.zeros((chunk_size, *encoder.shape), dtype=np.uint8)
+    actions = np.zeros(chunk_size, dtype=np.int8)
+    rewards = np.zeros(chunk_size, dtype=np.float32)
+    next_states = np.zeros((chunk_size, *encoder.shape), dtype=np.uint8)
+    dones = np.zeros(chunk_size, dtype=bool)
+    scores = []
+    filled = 0
+    steps = 0
+
+    while not stop.is_set():
+        state_old = encoder.encode(game, out=states[filled])
+        final_move = epsilon_greedy(model, inputs, state_old, 80 - n_games.value)
+        reward, done, score = game.play_step(final_move)
+
+        actions[filled] = final_move.index(1)
+        rewards[filled] = reward
+        encoder.encode(game, out=next_states[filled])
+        dones[filled] = done
+        filled += 1
+
+        if done:
+            game.reset()
+            with n_games.get_lock():
+                n_games.value += 1
+            scores.append(score)
+
+        if filled == chunk_size:
+            chunk = (states.copy(), actions.copy(), rewards.copy(), next_states.copy(), dones.copy(), scores)
+            while not stop.is_set():
+                try:
+                    transitions.put(chunk, timeout=0.5)
+                    break
+                except queue.Full:
+                    pass
+            filled = 0
+            scores = []
+
+        steps += 1
+        if steps % sync_steps == 0 and version.value != local_version:
+            with lock:
+                model.load_state_dict(shared_model.state_dict())
+                local_version = version.value
+
+
+def train_distributed(num_actors=NUM_ACTORS, chunk_size=ACTOR_CHUNK, sync_steps=ACTOR_SYNC_STEPS,
+                      publish_every=LEARNER_PUBLISH_EVERY, seed=0):
+    """
+    Trains the Snake AI with several actor processes playing games and one learner,
+    this process, updating the model from the replay memory at its own pace. The actors
+    and the learner build their models from the same settings (OBSERVATION), so either
+    observation mode can be trained.
+
+    Parameters:
+    -----------
+    num_actors : int
+        The number of actor processes.
+    chunk_size : int
+        The number of transitions an actor sends at a time.
+    sync_steps : int
+        How many moves an actor plays between checks for new weights.
+    publish_every : int
+        How many learner updates happen between publishing weights to the actors.
+    seed : int
+        The base seed; actor i uses seed + i.
+    """
+    if FRAME_STACK != 1 or N_STEP != 1:
+        # The chunks of all actors are interleaved in one replay memory, which cannot tell
+        # which earlier frames and later rewards of a transition belong to the same game
+        raise ValueError(f'distributed training needs FRAME_STACK = 1 and N_STEP = 1, '
+                         f'not {FRAME_STACK} and {N_STEP}; use train() or train_vectorized() instead')
+    ctx = mp.get_context('spawn')
+    torch.manual_seed(seed)
+    # The learner's model and memory are built like each actor's, uniform replay aside
+    learner = Agent(prioritized=False)
+    model, trainer, memory = learner.model, learner.trainer, learner.memory
+    memory.rng = np.random.default_rng(seed)
+
+    shared_model = copy.deepcopy(model)
+    shared_model.share_memory()
+    lock = ctx.Lock()
+    version = ctx.Value('i', 0)
+    n_games = ctx.Value('i', 0)
+    stop = ctx.Event()
+    transitions = ctx.Queue(maxsize=4 * num_actors)
+
+    actors = [
+        ctx.Process(target=actor, daemon=True, args=(
+            i, shared_model, lock, version, n_games, transitions, stop, chunk_size, sync_steps, seed))
+        for i in range(num_actors)
+    ]
+    for p in actors:
+        p.start()
+
+    metrics = MetricsWriter()
+    games = 0
+    total_score = 0
+    record = 0
+    updates = 0
+    try:
+        while True:
+            # Take what the actors have sent, waiting only while there is not enough to train on
+            for _ in range(num_actors):
+                try:
+                    chunk = transitions.get(timeout=1.0) if len(memory) < BATCH_SIZE else transitions.get_nowait()
+                except queue.Empty:
+                    # Actors only exit once stopped, so an exited actor has failed
+                    dead = [i for i, p in enumerate(actors) if not p.is_alive()]
+                    if dead:
+                        raise RuntimeError(f'actors {dead} exited with codes {[actors[i].exitcode for i in dead]}')
+                    break
+                *batch, scores = chunk
+                memory.extend(*batch)
+                for score in scores:
+                    games += 1
+                    total_score += score
+                    if score > record:
+                        record = score
+                        model.save()
+                    mean_score = total_score / games
+                    print('Game', games, 'Score', score, 'Record:', record,
+                          'Mean:', round(mean_score, 2), 'Updates:', updates)
+                    metrics.log(game=games, score=score, mean_score=mean_score, record=record, updates=updates)
+
+            if len(memory) < BATCH_SIZE:
+                continue
+            trainer.train_batch(*memory.sample(BATCH_SIZE))
+            updates += 1
+
+            if updates % publish_every == 0:
+                with lock:
+                    shared_model.load_state_dict(model.state_dict())
+                    version.value += 1
+    finally:
+        stop.set()
+        while any(p.is_alive() for p in actors):
+            try:
+                transitions.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for p in actors:
+            p.join()
+        metrics.close()
+
+
+if __name__ == '__main__':
+    train_distributed()
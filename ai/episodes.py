@@ -0,0 +1,188 @@
+from settings import *
+from api.recording import EpisodeReader, DIRECTIONS, DIR_INDEX
+from .snake_ai import SnakeGameAI
+from .state import StateEncoder, GridEncoder
+import argparse
+import numpy as np
+
+ACTIONS = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+# Relative action index (straight, right, left) of each clockwise turn; a reversal (2) has none
+TURN_ACTION = [0, 1, None, 2]
+
+
+def replay(episode, game=None):
+    """
+    Resets a game to the start of a recorded episode and returns a generator that plays
+    its steps. The food is drawn from the episode's seed, so the game unfolds exactly as
+    it was played.
+
+    Parameters:
+    -----------
+    episode : Episode
+        An episode from an EpisodeReader.
+    game : SnakeGameAI, optional
+        The game to replay into, e.g. one with a window to watch the episode. Its board
+        size must match the episode's. A headless game by default.
+
+    Returns:
+    --------
+    generator
+        Yields (action, reward, done, score) after each step, with action the index of
+        the relative action [straight, right, left], or None when a human player reversed.
+    """
+    if game is None:
+        game = SnakeGameAI(True, episode.cols, episode.rows)
+    game.frame_limit = None if episode.human else 100
+    game.reset(episode.seed)
+    return _play(episode, game)
+
+
+def _play(episode, game):
+    """
+    Plays the recorded steps of an episode into a game reset by replay().
+    """
+    for d in episode.actions.tolist():
+        action = TURN_ACTION[(d - DIR_INDEX[game.direction]) % 4]
+        # Setting the direction and going straight also replays a reversal into the body
+        game.direction = DIRECTIONS[d]
+        reward, done, score = game.play_step(ACTIONS[0])
+        yield action, reward, done, score
+
+
+def load_episodes(path, memory, encoder=None, chunk_size=4096):
+    """
+    Replays every episode of a log headless and adds its transitions to a replay memory,
+    e.g. to pre-train an Agent offline. Human reversals, which have no relative action
+    and always end the game, are skipped.
+
+    Parameters:
+    -----------
+    path : str
+        The episode log.
+    memory : ReplayBuffer
+        The memory the transitions are added to, e.g. Agent.memory.
+    encoder : StateEncoder or GridEncoder, optional
+        The encoder of the memory's observations, e.g. Agent.encoder. Defaults to the
+        11 features. A GridEncoder only loads episodes played on its board size.
+    chunk_size : int
+        The number of transitions added per ReplayBuffer.extend call.
+
+    Returns:
+    --------
+    int
+        The number of transitions added.
+
+    Raises:
+    -------
+    ValueError
+        If the memory stores observations of another shape than the encoder's, or an
+        episode was played on another board size than a GridEncoder's.
+    """
+    if encoder is None:
+        encoder = StateEncoder()
+    if memory.frames.shape[1:] != encoder.shape:
+        raise ValueError(f'the memory stores observations of shape {memory.frames.shape[1:]}, the encoder '
+                         f'gives {encoder.shape}; pass the agent\'s encoder: load_episodes(path, agent.memory, agent.encoder)')
+    state = np.empty(encoder.shape, dtype=np.uint8)
+    states = np.empty((chunk_size, *encoder.shape), dtype=np.uint8)
+    actions = np.empty(chunk_size, dtype=np.int8)
+    rewards = np.empty(chunk_size, dtype=np.float32)
+    next_states = np.empty((chunk_size, *encoder.shape), dtype=np.uint8)
+    dones = np.empty(chunk_size, dtype=bool)
+    filled = 0
+    added = 0
+    game = None
+
+    reader = EpisodeReader(path)
+    if isinstance(encoder, GridEncoder):
+        # checked up front, so a log that does not fit adds nothing
+        sizes = {(episode.cols, episode.rows) for episode in reader} - {(encoder.cols, encoder.rows)}
+        if sizes:
+            raise ValueError(f'{path} has episodes on {", ".join(f"{c}x{r}" for c, r in sorted(sizes))} boards, '
+                             f'the grid encoder takes {encoder.cols}x{encoder.rows}')
+
+    for episode in reader:
+        if game is None or (game.cols, game.rows) != (episode.cols, episode.rows):
+            game = SnakeGameAI(True, episode.cols, episode.rows)
+        steps = replay(episode, game)
+        encoder.encode(game, out=state)
+        for action, reward, done, _ in steps:
+            if action is None:
+                continue
+            states[filled] = state
+            actions[filled] = action
+            rewards[filled] = reward
+            dones[filled] = done
+            state[:] = encoder.encode(game, out=next_states[filled])
+            filled += 1
+            if filled == chunk_size:
+                memory.extend(states, actions, rewards, next_states, dones)
+                added += filled
+                filled = 0
+    if filled:
+        memory.extend(states[:filled], actions[:filled], rewards[:filled], next_states[:filled], dones[:filled])
+        added += filled
+    return added
+
+
+def watch(path, episodes=None, fps=FPS):
+    """
+    Replays episodes of a log in a window.
+
+    Parameters:
+    -----------
+    path : str
+        The episode log.
+    episodes : list, optional
+        The indices of the episodes to show. Defaults to all of them.
+    fps : int
+        Frames per second; 0 replays as fast as the game can be drawn.
+    """
+    reader = EpisodeReader(path)
+    game = None
+    for i in range(len(reader)) if episodes is None else episodes:
+        episode = reader[i]
+        if game is None or (game.cols, game.rows) != (episode.cols, episode.rows):
+            game = SnakeGameAI(False, episode.cols, episode.rows)
+            game.fps = fps
+        for _ in replay(episode, game):
+            pass
+        print('Episode', i, 'Score', game.score)
+
+
+def verify(path):
+    """
+    Replays every episode of a log headless and checks it reaches its recorded score.
+
+    Returns:
+    --------
+    list
+        The indices of the episodes that did not.
+    """
+    reader = EpisodeReader(path)
+    mismatches = []
+    for i, episode in enumerate(reader):
+        game = SnakeGameAI(True, episode.cols, episode.rows)
+        for _ in replay(episode, game):
+            pass
+        if game.score != episode.score:
+            mismatches.append(i)
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m ai.episodes', description='Inspect, verify and watch episode logs')
+    parser.add_argument('log', help='episode log written with SnakeGameAI(record=...) or Snake(record=...)')
+    parser.add_argument('--watch', nargs='*', type=int, metavar='EPISODE', help='replay episodes in a window (all by default)')
+    parser.add_argument('--fps', type=int, default=FPS, help='replay speed for --watch, 0 for unlimited')
+    parser.add_argument('--verify', action='store_true', help='replay headless and check the recorded scores')
+    args = parser.parse_args()
+
+    reader = EpisodeReader(args.log)
+    print(f'{len(reader)} episodes, {reader.total_steps} steps, '
+          f'mean score {reader.scores.mean() if len(reader) else 0:.2f}, max score {reader.scores.max(initial=0)}')
+    if args.verify:
+        bad = verify(args.log)
+        print('all episodes replay exactly' if not bad else f'{len(bad)} episodes differ: {bad[:20]}')
+    if args.watch is not None:
+        watch(args.log, args.watch or None, args.fps)
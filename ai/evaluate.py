@@ -0,0 +1,155 @@
+from settings import *
+from .snake_ai import SnakeGameAI
+from .state import StateEncoder, GridEncoder, STATE_SIZE
+from .runtime import MLPPolicy
+import argparse
+import multiprocessing as mp
+import numpy as np
+
+END_REASONS = ('wall', 'self', 'timeout', 'win')
+
+
+def play_games(path, games, seed, cols=COLS, rows=ROWS):
+    """
+    Plays greedy headless games with one model. Runs inside a pool worker.
+
+    Feature models choose their moves with the fused NumPy forward pass, and grid models
+    (Conv_QNet with the 3 'grid' or 4 'grid_age' channels) with torch. Frame-stacked
+    models are rejected, since their channels do not tell how many frames they stack.
+
+    Parameters:
+    -----------
+    path : str
+        The model to play, see ai.model.load_model.
+    games : int
+        The number of games to play.
+    seed : int
+        Seed for the food placement of these games.
+    cols, rows : int
+        The board size in cells.
+
+    Returns:
+    --------
+    list
+        One (score, steps, end_reason) tuple per game.
+    """
+    # torch is only needed by the workers, so the parent process starts without it
+    import torch
+    from .checkpoint import seed_everything
+    from .model import Conv_QNet, load_model
+
+    torch.set_num_threads(1)
+    seed_everything(seed)
+    model = load_model(path)
+    if isinstance(model, Conv_QNet):
+        channels = model.conv1.in_channels
+        if channels not in (3, 4):
+            raise ValueError(f'{path} takes {channels} grid channels, games give 3 or 4 '
+                             '(frame-stacked models cannot be evaluated)')
+        encoder = GridEncoder(cols, rows, age=channels == 4)
+
+        def act(state):
+            with torch.inference_mode():
+                return torch.argmax(model(torch.from_numpy(state))).item()
+    else:
+        # moves are chosen one state at a time, where the fused NumPy forward pass is fastest
+        policy = MLPPolicy.from_model(model)
+        if policy.input_size != STATE_SIZE:
+            raise ValueError(f'{path} takes {policy.input_size} features, games give {STATE_SIZE} '
+                             '(frame-stacked models cannot be evaluated)')
+        encoder = StateEncoder()
+        act = policy.act
+    game = SnakeGameAI(True, cols, rows)
+    action = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+    results = []
+    while len(results) < games:
+        _, done, score = game.play_step(action[act(encoder.encode(game))])
+        if done:
+            results.append((score, game.frame_iteration, game.end_reason))
+            game.reset()
+    return results
+
+
+def summarize(results):
+    """
+    Summarizes (score, steps, end_reason) tuples.
+
+    Returns:
+    --------
+    dict
+        Mean, median and p95 score, mean and median survival steps, the timeout rate and
+        the fraction of games ending in each reason.
+    """
+    scores = np.array([r[0] for r in results], dtype=float)
+    steps = np.array([r[1] for r in results], dtype=float)
+    reasons = [r[2] for r in results]
+    summary = {
+        'games': len(results),
+        'mean_score': scores.mean(),
+        'median_score': np.median(scores),
+        'p95_score': np.percentile(scores, 95),
+        'max_score': scores.max(),
+        'mean_steps': steps.mean(),
+        'median_steps': np.median(steps),
+    }
+    for reason in END_REASONS:
+        summary[reason] = reasons.count(reason) / len(results)
+    summary['timeout_rate'] = summary['timeout']
+    return summary
+
+
+def evaluate(models=('model.pth',), games=EVAL_GAMES, processes=EVAL_PROCESSES, seed=0, cols=COLS, rows=ROWS):
+    """
+    Plays `games` greedy headless games with each model across a process pool and
+    prints a comparison table. Every model sees the same seeds, so the same food
+    sequence for as long as the games stay identical.
+
+    Parameters:
+    -----------
+    models : list
+        Model files or checkpoint directories, see ai.model.load_model.
+    games : int
+        The number of games per model.
+    processes : int
+        The size of the process pool.
+    seed : int
+        The base seed; the games are split in chunks seeded seed, seed + 1, ...
+    cols, rows : int
+        The board size in cells.
+
+    Returns:
+    --------
+    dict
+        The summary of each model, keyed by its path.
+    """
+    chunks = max(1, min(games, 4 * processes))
+    sizes = [games // chunks + (i < games % chunks) for i in range(chunks)]
+    tasks = [(path, size, seed + i, cols, rows) for path in models for i, size in enumerate(sizes)]
+
+    with mp.get_context('spawn').Pool(processes) as pool:
+        outputs = pool.starmap(play_games, tasks)
+
+    summaries = {}
+    for j, path in enumerate(models):
+        results = [r for out in outputs[j * chunks:(j + 1) * chunks] for r in out]
+        summaries[path] = summarize(results)
+
+    print(f"{'model':<40} {'mean':>7} {'median':>7} {'p95':>7} {'max':>5} {'steps':>8} "
+          f"{'wall':>6} {'self':>6} {'timeout':>8} {'win':>5}")
+    for path, s in summaries.items():
+        print(f"{path:<40} {s['mean_score']:7.2f} {s['median_score']:7.1f} {s['p95_score']:7.1f} "
+              f"{s['max_score']:5.0f} {s['mean_steps']:8.1f} {s['wall']:6.1%} {s['self']:6.1%} "
+              f"{s['timeout']:8.1%} {s['win']:5.1%}")
+    return summaries
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m ai.evaluate', description='Greedy evaluation of saved models')
+    parser.add_argument('models', nargs='*', default=['model.pth'], help='model files or checkpoint directories')
+    parser.add_argument('--games', type=int, default=EVAL_GAMES)
+    parser.add_argument('--processes', type=int, default=EVAL_PROCESSES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cols', type=int, default=COLS)
+    parser.add_argument('--rows', type=int, default=ROWS)
+    args = parser.parse_args()
+    evaluate(args.models, args.games, args.processes, args.seed, args.cols, args.rows)
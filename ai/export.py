@@ -0,0 +1,160 @@
+from settings import *
+from .model import Linear_QNet, Conv_QNet, load_model, quantize
+import argparse
+import importlib.util
+import warnings
+import numpy as np
+import torch
+
+
+def example_input(model, cols=COLS, rows=ROWS):
+    """
+    Returns a batch of one random state in the model's input format, to trace it with.
+    """
+    if isinstance(model, Conv_QNet):
+        return torch.randint(0, 256, (1, model.conv1.in_channels, rows, cols)).float()
+    return torch.randint(0, 2, (1, model.linear1.in_features)).float()
+
+
+def export_torchscript(model, path):
+    """
+    Writes the model as TorchScript, which torch.jit.load runs without this repository.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)  # newer torch deprecates TorchScript in favour of torch.export
+        torch.jit.script(model).save(path)
+
+
+def load_torchscript(path):
+    """
+    Loads a model written by export_torchscript.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)
+        return torch.jit.load(path)
+
+
+def export_onnx(model, path, example):
+    """
+    Writes the model as ONNX with a dynamic batch size, for runtimes without Python torch.
+    Needs the onnx package.
+    """
+    kwargs = dict(input_names=['state'], output_names=['q_values'], dynamic_axes={'state': {0: 'batch'}, 'q_values': {0: 'batch'}})
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)  # the dynamo exporter is the default in newer torch
+        try:
+            torch.onnx.export(model, (example,), path, dynamo=False, **kwargs)
+        except TypeError:  # torch before the dynamo exporter
+            torch.onnx.export(model, (example,), path, **kwargs)
+
+
+def export_npz(model, path):
+    """
+    Writes the parameters of a Linear_QNet as float32 NumPy arrays, named as in its state
+    dict, for ai.runtime.MLPPolicy.
+    """
+    if not isinstance(model, Linear_QNet):
+        raise ValueError('only Linear_QNet models can be exported for the NumPy runtime')
+    np.savez(path, **{name: p.detach().numpy().astype(np.float32) for name, p in model.state_dict().items()})
+
+
+def export(path='model.pth', output=None, torchscript=True, onnx=False, npz=True, int8=False, cols=COLS, rows=ROWS,
+           samples=4096):
+    """
+    Exports a trained model and checks that every export picks the same greedy actions as
+    the model on random states. The ONNX export is only checked when onnxruntime is
+    installed.
+
+    Parameters:
+    -----------
+    path : str
+        The model, see load_model.
+    output : str, optional
+        The path of the exports without extension. Defaults to the model's path, or to
+        <checkpoint>/model for a checkpoint directory.
+    torchscript, onnx, npz, int8 : bool
+        Which exports to write: <output>.pt, <output>.onnx, <output>.npz and the
+        TorchScript of the int8 quantized model, <output>.int8.pt. The NumPy export is
+        skipped for convolutional models. The int8 model only has to keep
+        INT8_MIN_AGREEMENT of the greedy actions.
+    cols, rows : int
+        The board size of the grid states a convolutional model is traced and checked on.
+    samples : int
+        The number of random states checked.
+
+    Returns:
+    --------
+    dict
+        The written file of each export.
+    """
+    if onnx and importlib.util.find_spec('onnx') is None:
+        raise ImportError('ONNX export needs the onnx package: pip install onnx')
+    model = load_model(path)
+    if output is None:
+        if os.path.isdir(path):
+            # inside the checkpoint, so the checkpoint directory holds nothing but checkpoints
+            output = os.path.join(path, 'model')
+        else:
+            output = os.path.splitext(path if os.path.exists(path) else os.path.join(AI, 'model', path))[0]
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    example = example_input(model, cols, rows)
+    states = torch.cat([example_input(model, cols, rows) for _ in range(samples)])
+    with torch.inference_mode():
+        expected = model(states)
+    files = {}
+
+    if torchscript:
+        files['torchscript'] = output + '.pt'
+        export_torchscript(model, files['torchscript'])
+        with torch.inference_mode():
+            _check('torchscript', expected, load_torchscript(files['torchscript'])(states))
+    if int8:
+        files['int8'] = output + '.int8.pt'
+        export_torchscript(quantize(model), files['int8'])
+        with torch.inference_mode():
+            _check('int8', expected, load_torchscript(files['int8'])(states), INT8_MIN_AGREEMENT)
+    if onnx:
+        files['onnx'] = output + '.onnx'
+        export_onnx(model, files['onnx'], example)
+        if importlib.util.find_spec('onnxruntime') is None:
+            print(f"{'onnx':<12} not checked, needs the onnxruntime package")
+        else:
+            import onnxruntime
+
+            session = onnxruntime.InferenceSession(files['onnx'], providers=['CPUExecutionProvider'])
+            _check('onnx', expected, torch.from_numpy(session.run(None, {'state': states.numpy()})[0]))
+    if npz and isinstance(model, Linear_QNet):
+        from .runtime import MLPPolicy
+
+        files['npz'] = output + '.npz'
+        export_npz(model, files['npz'])
+        _check('numpy', expected, torch.from_numpy(MLPPolicy(files['npz']).q_values(states.numpy())))
+    for name, file in files.items():
+        print(f'{name:<12} {file} ({os.path.getsize(file) / 1024:.1f} KB)')
+    return files
+
+
+def _check(name, expected, q, min_agreement=1.0):
+    """
+    Raises if an export's Q values pick the model's actions on less than min_agreement of
+    the states.
+    """
+    agree = (q.argmax(dim=1) == expected.argmax(dim=1)).float().mean().item()
+    error = (q - expected).abs().max().item()
+    print(f'{name:<12} action agreement {agree:.2%}, max |dQ| {error:.2e}')
+    if agree < min_agreement:
+        raise RuntimeError(f'the {name} export disagrees with the model on {1 - agree:.2%} of states')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m ai.export', description='Export a trained model for deployment')
+    parser.add_argument('model', nargs='?', default='model.pth', help='model file, in ai/model or a path, or a checkpoint directory')
+    parser.add_argument('--output', help='path of the exports without extension (default: next to the model)')
+    parser.add_argument('--onnx', action='store_true', help='also write ONNX (needs the onnx package)')
+    parser.add_argument('--no-torchscript', dest='torchscript', action='store_false')
+    parser.add_argument('--no-npz', dest='npz', action='store_false', help='skip the weights for the NumPy runtime')
+    parser.add_argument('--int8', action='store_true', help='also write the int8 quantized model as TorchScript')
+    parser.add_argument('--cols', type=int, default=COLS)
+    parser.add_argument('--rows', type=int, default=ROWS)
+    args = parser.parse_args()
+    export(args.model, args.output, args.torchscript, args.onnx, args.npz, args.int8, args.cols, args.rows)
@@ -0,0 +1,302 @@
+from settings import *
+from .model import Linear_QNet, load_model, quantize
+from .runtime import MLPPolicy
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import queue
+import threading
+import time
+import urllib.request
+import numpy as np
+import torch
+
+
+class PolicyServer:
+    """
+    Serves greedy actions from a saved Linear_QNet to many games at once. Models trained on
+    grid observations are not served, since requests carry feature vectors.
+
+    Requests from any number of threads are queued and a worker thread runs them through
+    the model in micro-batches: a batch is closed when it reaches max_batch states or
+    when its first request has waited max_latency seconds, whichever comes first.
+    The forward passes run under torch.inference_mode in float32 or int8, or in NumPy
+    with the fused kernel of ai.runtime.MLPPolicy, which gives the float32 actions
+    several times faster on small batches.
+
+    Attributes:
+    -----------
+    model : Linear_QNet
+        The policy, in eval mode.
+    backend : str
+        'torch', 'int8' or 'numpy'.
+    max_batch : int
+        The largest micro-batch.
+    max_latency : float
+        The longest a request waits for its batch to fill, in seconds.
+
+    Methods:
+    --------
+    start():
+        Starts the batching worker.
+    stop():
+        Stops the worker once the queued requests are answered.
+    submit(state):
+        Queues one state and returns a Future of its action index.
+    act(state):
+        Returns the action index for one state, blocking until its batch has run.
+    act_batch(states):
+        Returns the action indices for a batch of states in one forward pass.
+    """
+    def __init__(self, model_path='model.pth', max_batch=INFERENCE_MAX_BATCH, max_latency=INFERENCE_MAX_LATENCY,
+                 backend=INFERENCE_BACKEND):
+        self.model = load_model(model_path)
+        if not isinstance(self.model, Linear_QNet):
+            raise ValueError(f'{model_path} is a {type(self.model).__name__}: the policy server only serves '
+                             'Linear_QNet feature models (evaluate grid models with python -m ai.evaluate)')
+        self.backend = backend
+        if backend == 'torch':
+            self._policy = self.model
+        elif backend == 'int8':
+            self._policy = quantize(self.model)
+        elif backend == 'numpy':
+            self._policy = MLPPolicy.from_model(self.model)
+        else:
+            raise ValueError(f"unknown inference backend {backend!r}, expected 'torch', 'int8' or 'numpy'")
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._requests = queue.SimpleQueue()
+        self._thread = None
+        self._running = False
+        self._lock = threading.Lock()  # nothing is queued behind the worker's stop signal
+
+    def start(self):
+        """
+        Starts the batching worker thread.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='policy-server', daemon=True)
+                self._thread.start()
+                self._running = True
+        return self
+
+    def stop(self):
+        """
+        Stops the worker thread after it has answered the requests already queued. Later
+        submits raise RuntimeError until the server is started again.
+        """
+        with self._lock:
+            if self._thread is None:
+                return
+            self._running = False
+            self._requests.put(None)
+        self._thread.join()
+        self._thread = None
+        while True:
+            try:
+                request = self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request[1].set_exception(RuntimeError('the policy server stopped'))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def submit(self, state):
+        """
+        Queues one state for the next micro-batch.
+
+        Parameters:
+        -----------
+        state : array-like
+            The 11 feature state, as built by Agent.get_state.
+
+        Returns:
+        --------
+        concurrent.futures.Future
+            Resolves to the action index (0 straight, 1 right, 2 left).
+
+        Raises:
+        -------
+        ValueError
+            If the state does not have the model's number of features.
+        RuntimeError
+            If the server has not been started or has been stopped.
+        """
+        state = np.asarray(state, dtype=np.float32)
+        if state.shape != (self.model.linear1.in_features,):
+            raise ValueError(f'expected a state of {self.model.linear1.in_features} features, got shape {state.shape}')
+        future = Future()
+        with self._lock:
+            if not self._running:
+                raise RuntimeError('the policy server is not running, call start() first')
+            self._requests.put((state, future))
+        return future
+
+    def act(self, state, timeout=None):
+        """
+        Returns the action index for one state, batched with concurrent requests.
+        """
+        return self.submit(state).result(timeout)
+
+    def act_batch(self, states):
+        """
+        Returns the action indices for a batch of states, run immediately in one forward pass.
+
+        Parameters:
+        -----------
+        states : array-like
+            (n, 11) states.
+
+        Returns:
+        --------
+        np.ndarray
+            (n,) action indices.
+        """
+        if self.backend == 'numpy':
+            return self._policy.act_batch(np.asarray(states, dtype=np.float32))
+        with torch.inference_mode():
+            q = self._policy(torch.as_tensor(np.asarray(states, dtype=np.float32)))
+            return torch.argmax(q, dim=1).numpy()
+
+    def _run(self):
+        """
+        Worker loop: gathers a micro-batch, runs it and resolves its futures.
+        """
+        batch = np.empty((self.max_batch, self.model.linear1.in_features), dtype=np.float32)
+        stopping = False
+        while not stopping:
+            request = self._requests.get()
+            if request is None:
+                break
+            requests = []
+            deadline = time.monotonic() + self.max_latency
+            while True:
+                requests.append(request)
+                if len(requests) == self.max_batch:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    request = self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+            # A failure fails this batch's requests, never the worker
+            try:
+                for i, (state, _) in enumerate(requests):
+                    batch[i] = state
+                actions = self.act_batch(batch[:len(requests)])
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+            for (_, future), action in zip(requests, actions):
+                future.set_result(int(action))
+
+
+def make_handler(server, timeout=INFERENCE_TIMEOUT):
+    """
+    Returns an HTTP request handler class answering from the given PolicyServer. Invalid
+    states are answered with 400, and requests whose actions take longer than `timeout`
+    seconds, or arrive while the server is stopped, with 503.
+
+    Endpoints:
+        GET  /health                     -> {"status": "ok"}
+        POST /act  {"state": [...]}      -> {"action": 0}
+        POST /act  {"states": [[...]]}   -> {"actions": [0, 2, ...]}
+    """
+    class PolicyHandler(BaseHTTPRequestHandler):
+        def _reply(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._reply(200, {'status': 'ok'})
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/act':
+                self._reply(404, {'error': 'not found'})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                if 'states' in body:
+                    futures = [server.submit(state) for state in body['states']]
+                    deadline = time.monotonic() + timeout
+                    self._reply(200, {'actions': [f.result(max(0.0, deadline - time.monotonic())) for f in futures]})
+                else:
+                    self._reply(200, {'action': server.act(body['state'], timeout)})
+            except (KeyError, ValueError, TypeError) as e:
+                self._reply(400, {'error': str(e)})
+            except TimeoutError:
+                self._reply(503, {'error': f'no action within {timeout} s'})
+            except RuntimeError as e:
+                self._reply(503, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            pass  # one line per request would dominate the cost of serving small requests
+
+    return PolicyHandler
+
+
+def serve_http(server, host=INFERENCE_HOST, port=INFERENCE_PORT):
+    """
+    Serves a started PolicyServer over HTTP until interrupted.
+    """
+    httpd = ThreadingHTTPServer((host, port), make_handler(server))
+    print(f'Serving policy on http://{host}:{port}/act')
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+class PolicyClient:
+    """
+    Minimal client for a policy served by serve_http, usable by bots and evaluation workers.
+    """
+    def __init__(self, url=f'http://{INFERENCE_HOST}:{INFERENCE_PORT}'):
+        self.url = url.rstrip('/')
+
+    def _post(self, body):
+        request = urllib.request.Request(self.url + '/act', data=json.dumps(body).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    def act(self, state):
+        """Returns the action index for one state."""
+        return self._post({'state': np.asarray(state).tolist()})['action']
+
+    def act_batch(self, states):
+        """Returns the action indices for a batch of states."""
+        return self._post({'states': np.asarray(states).tolist()})['actions']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m ai.inference', description='Serve a saved Linear_QNet over HTTP')
+    parser.add_argument('--model', default='model.pth', help='model file, in ai/model or a path')
+    parser.add_argument('--host', default=INFERENCE_HOST)
+    parser.add_argument('--port', type=int, default=INFERENCE_PORT)
+    parser.add_argument('--max-batch', type=int, default=INFERENCE_MAX_BATCH)
+    parser.add_argument('--max-latency', type=float, default=INFERENCE_MAX_LATENCY, help='seconds')
+    parser.add_argument('--backend', choices=('torch', 'int8', 'numpy'), default=INFERENCE_BACKEND)
+    args = parser.parse_args()
+    with PolicyServer(args.model, args.max_batch, args.max_latency, args.backend) as policy:
+        serve_http(policy, args.host, args.port)
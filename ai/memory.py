@@ -0,0 +1,527 @@
+from settings import *
+import json
+import numpy as np
+import torch
+
+
+class ReplayBuffer:
+    """
+    Fixed-size ring buffer of experience transitions held in preallocated NumPy arrays.
+
+    Every observation is stored once. A transition keeps its state and an offset to the
+    slot holding its next state, which is the state of the same game's following
+    transition, so next states are gathered by index at sample time rather than stored
+    a second time. Transitions are written as steps of `streams` interleaved games (the
+    games of a VectorSnakeEnv, or 1 for a single game). A next state that is not the
+    following state of its game, e.g. where the chunks of two actors meet, is kept in a
+    slot of its own; the next state of an episode's last move is never needed.
+
+    At sample time the rewards of n_step moves are summed into discounted returns
+    r + gamma r' + ... along these links, stopping at the end of an episode, and states
+    are stacked with the frame_stack - 1 previous observations of their game, zeros
+    before its first. A transition is sampled only once all of its n_step moves are stored.
+    Frame stacking assumes each stream carries its games' moves in order, as Agent.remember,
+    train_vectorized and load_episodes write them; the chunks of distributed actors do not.
+
+    Observations are stored as uint8, actions as int8 indices into [straight, right,
+    left], rewards as float32 and dones as bool. Once full, the oldest slots are
+    overwritten, like a deque with maxlen.
+
+    Attributes:
+    -----------
+    capacity : int
+        The maximum number of slots kept.
+    n_step : int
+        The number of moves summed into each sampled return.
+    gamma : float
+        The discount of those returns, that of the QTrainer they are sampled for.
+    frame_stack : int
+        The number of observations stacked into each sampled state.
+    streams : int
+        The number of games interleaved in the batches passed to extend.
+    frames : np.ndarray
+        (capacity, *state_shape) uint8 observations.
+    actions : np.ndarray
+        (capacity,) int8 action indices, -1 in a slot holding only a next state.
+    rewards : np.ndarray
+        (capacity,) float32 rewards.
+    dones : np.ndarray
+        (capacity,) bool episode ends.
+    next_offset, prev_offset : np.ndarray
+        (capacity,) int32 distances to the slots of the next and previous observation
+        of the same game, 0 where there is none (yet); a prev_offset of -1 marks a state
+        whose history was not stored, which is not sampled with frame_stack > 1.
+    total : int
+        The number of slots ever written.
+
+    Methods:
+    --------
+    append(state, action, reward, next_state, done):
+        Stores one transition.
+    extend(states, actions, rewards, next_states, dones):
+        Stores a batch of transitions.
+    sample(batch_size):
+        Returns a batch of transitions as tensors.
+    state_dict():
+        Returns a copy of the stored transitions, for checkpoints.
+    load_state_dict(state):
+        Restores the transitions saved by state_dict.
+    """
+    def __init__(self, capacity=MAX_MEMORY, state_shape=(11,), seed=None, n_step=1, gamma=0.9, frame_stack=1,
+                 streams=1):
+        self.capacity = capacity
+        self.n_step = n_step
+        self.gamma = gamma
+        self.frame_stack = frame_stack
+        self.streams = streams
+        self.frames = np.zeros((capacity, *state_shape), dtype=np.uint8)
+        self.actions = np.zeros(capacity, dtype=np.int8)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.next_offset = np.zeros(capacity, dtype=np.int32)
+        self.prev_offset = np.zeros(capacity, dtype=np.int32)
+        self.rng = np.random.default_rng(seed)
+        self.total = 0
+        # Per game, the last transition still waiting for its next state (-1 for none) and that next state
+        self._pending = np.full(streams, -1, dtype=np.int64)
+        self._next_frames = np.zeros((streams, *state_shape), dtype=np.uint8)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def size(self):
+        """The number of slots in use."""
+        return min(self.total, self.capacity)
+
+    @property
+    def index(self):
+        """The next slot to write."""
+        return self.total % self.capacity
+
+    @property
+    def nbytes(self):
+        """The memory held by the preallocated arrays."""
+        return sum(a.nbytes for a in (self.frames, self.actions, self.rewards, self.dones, self.next_offset,
+                                      self.prev_offset))
+
+    def append(self, state, action, reward, next_state, done):
+        """
+        Stores one transition of a single game, overwriting the oldest slot when the buffer is full.
+
+        Parameters:
+        -----------
+        state, next_state : np.ndarray
+            The states before and after the move, of which only the newest observation is kept.
+        action : int or list
+            The action index, or the one-hot action [straight, right, left].
+        reward : float
+            The reward received.
+        done : bool
+            Whether the episode has ended.
+        """
+        depth = self.frames.shape[1]
+        frame = np.asarray(state)[-depth:]
+        prev = self._pending[0]
+        history = 0
+        if prev >= 0 and not np.array_equal(self._next_frames[0], frame):
+            # Not the pending transition's next state: keep that in a slot of its own
+            self._write_next_frames(self._pending[:1].copy(), self._next_frames[:1])
+            prev, history = -1, -1
+        a = self.total
+        i = a % self.capacity
+        self.frames[i] = frame
+        self.actions[i] = action if np.ndim(action) == 0 else np.argmax(action)
+        self.rewards[i] = reward
+        self.dones[i] = done
+        self.next_offset[i] = 0
+        self.prev_offset[i] = history
+        if prev >= 0 and a - prev < self.capacity:
+            self.next_offset[prev % self.capacity] = self.prev_offset[i] = a - prev
+        self.total = a + 1
+        self._pending[0] = -1 if done else a
+        if not done:
+            self._next_frames[0] = np.asarray(next_state)[-depth:]
+
+    def extend(self, states, actions, rewards, next_states, dones):
+        """
+        Stores a batch of transitions, with actions given as indices. The batch holds
+        whole steps of the interleaved games: transition i belongs to game i % streams,
+        and its next state is normally the state of transition i + streams.
+        """
+        depth = self.frames.shape[1]
+        k = self.streams
+        n = len(actions)
+        if n % k:
+            raise ValueError(f'a batch of {n} transitions is not a whole number of steps of {k} games')
+        states = np.asarray(states)[:, -depth:]
+        next_states = np.asarray(next_states)[:, -depth:]
+        dones = np.asarray(dones, dtype=bool)
+        a = self.total + np.arange(n)
+        slots = a % self.capacity
+
+        # Transitions followed by their game's next state within the batch, or continuing the pending ones
+        follows = np.zeros(n, dtype=bool)
+        follows[:-k] = ~dones[:-k] & _equal(next_states[:-k], states[k:])
+        pending = self._pending.copy()
+        continues = (pending >= 0) & _equal(self._next_frames, states[:k]) & (a[:k] - pending < self.capacity)
+
+        self.frames[slots] = states
+        self.actions[slots] = actions
+        self.rewards[slots] = rewards
+        self.dones[slots] = dones
+        self.next_offset[slots] = np.where(follows, k, 0)
+        self.prev_offset[slots[k:]] = np.where(follows[:-k], k, np.where(dones[:-k], 0, -1))
+        self.prev_offset[slots[:k]] = np.where(continues, a[:k] - pending, np.where(pending < 0, 0, -1))
+        self.next_offset[pending[continues] % self.capacity] = (a[:k] - pending)[continues]
+        self.total += n
+
+        # Next states that are not stored as a following state get slots of their own
+        broken = ~dones & ~follows
+        broken[-k:] = False
+        orphans = (pending >= 0) & ~continues
+        self._write_next_frames(np.concatenate([pending[orphans], a[broken]]),
+                                np.concatenate([self._next_frames[orphans], next_states[broken]]))
+
+        self._pending = np.where(dones[-k:], -1, a[-k:])
+        self._next_frames[:] = next_states[-k:]
+
+    def _write_next_frames(self, sources, frames):
+        """
+        Stores next states in slots of their own, linked from the transitions at the
+        absolute positions `sources`.
+        """
+        if len(sources) == 0:
+            return
+        a = self.total + np.arange(len(sources))
+        slots = a % self.capacity
+        self.frames[slots] = frames
+        self.actions[slots] = -1
+        self.rewards[slots] = 0
+        self.dones[slots] = False
+        self.next_offset[slots] = 0
+        linked = a - sources < self.capacity
+        self.prev_offset[slots] = np.where(linked, a - sources, 0)
+        self.next_offset[sources[linked] % self.capacity] = (a - sources)[linked]
+        self.total += len(sources)
+
+    def _positions(self, idx):
+        """Returns the absolute positions of the given slots."""
+        last = self.total - 1
+        return last - (last - np.asarray(idx, dtype=np.int64)) % self.capacity
+
+    def _returns(self, a):
+        """
+        Follows n_step moves from the transitions at absolute positions `a`.
+
+        Returns:
+        --------
+        tuple
+            Whether each can be sampled, its discounted return, whether its episode ended
+            within the n_step moves, and the position of the state to bootstrap from.
+        """
+        valid = self.actions[a % self.capacity] >= 0
+        returns = np.zeros(len(a), dtype=np.float32)
+        done = np.zeros(len(a), dtype=bool)
+        a = a.copy()
+        for step in range(self.n_step):
+            slots = a % self.capacity
+            live = valid & ~done
+            returns += np.where(live, np.float32(self.gamma ** step) * self.rewards[slots], 0)
+            done |= live & self.dones[slots]
+            live &= ~self.dones[slots]
+            offset = self.next_offset[slots]
+            valid &= ~live | (offset > 0)
+            a = np.where(live, a + offset, a)
+            if step < self.n_step - 1:
+                valid &= ~live | (self.actions[a % self.capacity] >= 0)
+        return valid, returns, done, a
+
+    def _history(self, a, valid):
+        """
+        Returns the absolute positions of the observations at `a` and of the frame_stack - 1
+        before them in their games, newest first, with -1 before a game's first. Samples
+        whose history was overwritten or not stored are marked invalid.
+        """
+        history = np.full((self.frame_stack, len(a)), -1, dtype=np.int64)
+        history[0] = a
+        oldest = self.total - self.size
+        alive = np.ones(len(a), dtype=bool)
+        for back in range(1, self.frame_stack):
+            offset = self.prev_offset[a % self.capacity]
+            valid &= ~alive | (offset >= 0)
+            alive &= offset > 0
+            a = a - offset
+            valid &= ~alive | (a >= oldest)
+            alive &= a >= oldest
+            history[back, alive] = a[alive]
+        return history
+
+    def _stack(self, a, valid):
+        """
+        Returns the observations at absolute positions `a` stacked with the frame_stack - 1
+        before them in their games, zeros before a game's first.
+        """
+        if self.frame_stack == 1:
+            return self.frames[a % self.capacity]
+        depth = self.frames.shape[1]
+        out = np.zeros((len(a), self.frame_stack * depth, *self.frames.shape[2:]), dtype=np.uint8)
+        for back, positions in enumerate(self._history(a, valid)):
+            stored = positions >= 0
+            end = (self.frame_stack - back) * depth
+            out[stored, end - depth:end] = self.frames[positions[stored] % self.capacity]
+        return out
+
+    def _valid(self, idx):
+        """Returns whether each slot holds a transition that can be sampled."""
+        a = self._positions(idx)
+        valid = self._returns(a)[0]
+        if self.frame_stack > 1:
+            self._history(a, valid)
+        return valid
+
+    def _draw(self, batch_size):
+        """Returns batch_size distinct random slots, or every slot in use when there are not more than that."""
+        if self.size > batch_size:
+            return self.rng.choice(self.size, batch_size, replace=False)
+        return np.arange(self.size)
+
+    def sample_indices(self, batch_size):
+        """
+        Returns up to batch_size random slots holding transitions that can be sampled.
+        Slots drawn that cannot, e.g. the last moves of a game still being played or
+        slots holding only a next state, are drawn again a few times, then dropped.
+        """
+        idx = self._draw(batch_size)
+        for _ in range(4):
+            invalid = ~self._valid(idx)
+            if not invalid.any():
+                return idx
+            if len(idx) == self.size:
+                break  # every slot was drawn
+            idx[invalid] = self._draw(int(invalid.sum()))
+        return idx[self._valid(idx)]
+
+    def get(self, idx):
+        """
+        Returns the transitions at the given slots as tensors, with n-step returns and
+        stacked states built from the stored observations.
+
+        Returns:
+        --------
+        tuple
+            states (uint8), actions (int8), returns (float32), next states (uint8) to
+            bootstrap from n_step moves later, and dones (bool) for episodes that ended
+            within those moves.
+        """
+        a = self._positions(idx)
+        valid, returns, done, bootstrap = self._returns(a)
+        return (torch.from_numpy(self._stack(a, valid)), torch.from_numpy(self.actions[a % self.capacity]),
+                torch.from_numpy(returns), torch.from_numpy(self._stack(bootstrap, valid)), torch.from_numpy(done))
+
+    def sample(self, batch_size):
+        """
+        Returns a uniformly sampled batch of transitions as tensors, like random.sample on the old deque.
+        """
+        return self.get(self.sample_indices(batch_size))
+
+    def state_dict(self):
+        """
+        Returns a copy of the stored slots, the ring position and the pending transitions, as a dict of NumPy arrays.
+        """
+        n = self.size
+        return {
+            'frames': self.frames[:n].copy(),
+            'actions': self.actions[:n].copy(),
+            'rewards': self.rewards[:n].copy(),
+            'dones': self.dones[:n].copy(),
+            'next_offset': self.next_offset[:n].copy(),
+            'prev_offset': self.prev_offset[:n].copy(),
+            'total': np.array(self.total),
+            'pending': self._pending.copy(),
+            'next_frames': self._next_frames.copy(),
+            'rng': np.array(json.dumps(self.rng.bit_generator.state)),
+        }
+
+    def load_state_dict(self, state):
+        """
+        Restores the slots saved by state_dict.
+        """
+        self.rng.bit_generator.state = json.loads(str(state['rng']))
+        n = len(state['actions'])
+        self.frames[:n] = state['frames']
+        self.actions[:n] = state['actions']
+        self.rewards[:n] = state['rewards']
+        self.dones[:n] = state['dones']
+        self.next_offset[:n] = state['next_offset']
+        self.prev_offset[:n] = state['prev_offset']
+        self.total = int(state['total'])
+        self._pending[:] = state['pending']
+        self._next_frames[:] = state['next_frames']
+
+
+def _equal(a, b):
+    """Returns whether each pair of observations in two batches is identical."""
+    return (a == b).all(axis=tuple(range(1, a.ndim)))
+
+
+class SumTree:
+    """
+    Binary tree where every node holds the sum of the priorities below it.
+
+    The leaves are stored after the internal nodes in one flat array, with the leaf
+    count rounded up to a power of two so every leaf sits at the same depth. Updating
+    a priority and finding the leaf for a prefix sum are both O(log n), and both are
+    done for a whole batch of indices at once.
+
+    Attributes:
+    -----------
+    leaves : int
+        The number of leaves (a power of two, at least the capacity).
+    tree : np.ndarray
+        (2 * leaves,) float64 sums; tree[1] is the root and leaf i is tree[leaves + i].
+    """
+    def __init__(self, capacity):
+        self.leaves = 1 << max(capacity - 1, 1).bit_length()
+        self.depth = self.leaves.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    @property
+    def total(self):
+        """The sum of all priorities."""
+        return self.tree[1]
+
+    def get(self, idx):
+        """Returns the priorities of the given leaves."""
+        return self.tree[self.leaves + np.asarray(idx)]
+
+    def update(self, idx, priorities):
+        """
+        Sets the priorities of the given leaves and refreshes the sums above them.
+        """
+        nodes = self.leaves + np.asarray(idx)
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """
+        Returns for each value the leaf whose cumulative priority range contains it.
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            go_right = values > self.tree[left]
+            values -= self.tree[left] * go_right
+            nodes = left + go_right
+        return nodes - self.leaves
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    ReplayBuffer that samples transitions in proportion to their priority.
+
+    A transition's priority is (|TD error| + eps) ** alpha; new transitions get the
+    highest priority seen so far so each is replayed at least once. Samples come with
+    importance-sampling weights (N * P(i)) ** -beta, normalised by their maximum, with
+    beta annealed linearly to 1 over beta_steps sampled batches.
+
+    Attributes:
+    -----------
+    alpha : float
+        How much prioritization is used, 0 being uniform.
+    beta : float
+        The current importance-sampling exponent.
+    tree : SumTree
+        The priorities of every slot.
+
+    Methods:
+    --------
+    sample(batch_size):
+        Returns a batch of transitions as tensors, the importance-sampling weights and the sampled slots.
+    update_priorities(idx, errors):
+        Sets the priorities of the sampled slots from their TD errors.
+    """
+    def __init__(self, capacity=MAX_MEMORY, state_shape=(11,), alpha=PER_ALPHA, beta=PER_BETA,
+                 beta_steps=PER_BETA_STEPS, eps=PER_EPS, seed=None, n_step=1, gamma=0.9, frame_stack=1, streams=1):
+        super().__init__(capacity, state_shape, seed, n_step, gamma, frame_stack, streams)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = (1.0 - beta) / beta_steps
+        self.eps = eps
+        self.max_priority = 1.0
+        self.tree = SumTree(capacity)
+
+    def append(self, state, action, reward, next_state, done):
+        start = self.total
+        super().append(state, action, reward, next_state, done)
+        self._prioritize(start)
+
+    def extend(self, states, actions, rewards, next_states, dones):
+        start = self.total
+        super().extend(states, actions, rewards, next_states, dones)
+        self._prioritize(start)
+
+    def _prioritize(self, start):
+        """
+        Gives the transitions written since absolute position `start` the highest priority
+        seen so far, and slots holding only a next state none, so they are never drawn.
+        """
+        idx = np.arange(start, self.total) % self.capacity
+        self.tree.update(idx, np.where(self.actions[idx] >= 0, self.max_priority, 0.0))
+
+    def _draw(self, batch_size):
+        """
+        Returns batch_size slots drawn in proportion to their priority, one from each
+        of batch_size equal slices of the total priority.
+        """
+        segment = self.tree.total / batch_size
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+        return np.minimum(self.tree.find(values), self.size - 1)
+
+    def sample(self, batch_size):
+        """
+        Returns a prioritized batch of transitions as tensors.
+
+        Returns:
+        --------
+        tuple
+            states, actions, rewards, next_states, dones, the float32 importance-sampling
+            weights and the sampled slots (to pass back to update_priorities).
+        """
+        idx = self.sample_indices(batch_size)
+        probs = self.tree.get(idx) / self.tree.total
+        weights = (self.size * probs) ** -self.beta
+        weights = (weights / weights.max(initial=0.0)).astype(np.float32)
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return (*self.get(idx), torch.from_numpy(weights), idx)
+
+    def update_priorities(self, idx, errors):
+        """
+        Sets the priorities of the given slots from their TD errors.
+
+        Parameters:
+        -----------
+        idx : np.ndarray
+            The slots returned by sample.
+        errors : torch.Tensor or np.ndarray
+            The TD errors of those transitions.
+        """
+        priorities = (np.abs(np.asarray(errors, dtype=np.float64)) + self.eps) ** self.alpha
+        self.tree.update(idx, priorities)
+        self.max_priority = max(self.max_priority, priorities.max())
+
+    def state_dict(self):
+        state = super().state_dict()
+        state['priorities'] = self.tree.get(np.arange(self.size))
+        state['max_priority'] = np.array(self.max_priority)
+        state['beta'] = np.array(self.beta)
+        return state
+
+    def load_state_dict(self, state):
+        super().load_state_dict(state)
+        self.tree.update(np.arange(self.size), state['priorities'])
+        self.max_priority = float(state['max_priority'])
+        self.beta = float(state['beta'])
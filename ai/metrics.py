@@ -0,0 +1,148 @@
+from settings import *
+import atexit
+import csv
+import json
+import queue
+import threading
+import multiprocessing as mp
+
+
+class MetricsWriter:
+    """
+    Non-blocking sink for training metrics.
+
+    log() only appends the record to an in-process ring buffer and a queue; a
+    background thread writes the queued records to a JSONL or CSV file (chosen by
+    the file extension), so the training loop never waits on disk or on plotting.
+
+    Attributes:
+    -----------
+    path : str
+        The metrics file, or None to keep records in memory only.
+    recent : deque
+        The most recent records, newest last.
+    append : bool
+        Continues an existing metrics file instead of truncating it.
+
+    Methods:
+    --------
+    log(**record):
+        Queues one record.
+    close():
+        Writes the remaining records and stops the writer thread.
+    """
+    def __init__(self, path=METRICS_FILE, history=METRICS_HISTORY, append=False):
+        self.path = path
+        self.recent = deque(maxlen=history)
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if not append:
+                open(path, 'w').close()  # a new run starts a new file, a resumed one continues it
+            self._thread = threading.Thread(target=self._run, name='metrics-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)  # training loops run until interrupted
+
+    def log(self, **record):
+        """
+        Queues one record, e.g. log(game=1, score=3, mean_score=3.0, record=3).
+        """
+        self.recent.append(record)
+        if self._thread is not None:
+            self._queue.put(record)
+
+    def close(self):
+        """
+        Writes the remaining records and stops the writer thread.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _csv_header(self):
+        """
+        Returns the header of an existing CSV file, so appended rows keep its columns, or None.
+        """
+        with open(self.path, newline='') as f:
+            return next(csv.reader(f), None)
+
+    def _run(self):
+        """
+        Writer thread: appends queued records to the file, flushing whenever the queue runs dry.
+        """
+        is_csv = self.path.endswith('.csv')
+        writer = None
+        with open(self.path, 'a', newline='') as f:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                if is_csv:
+                    if writer is None:
+                        writer = csv.DictWriter(f, fieldnames=self._csv_header() or list(record))
+                        if os.path.getsize(self.path) == 0:
+                            writer.writeheader()
+                    writer.writerow(record)
+                else:
+                    f.write(json.dumps(record, default=float) + '\n')
+                if self._queue.empty():
+                    f.flush()
+
+
+def read_metrics(f, is_csv, fieldnames=None):
+    """
+    Parses the complete lines appended to an open metrics file since the last call.
+
+    Parameters:
+    -----------
+    f : file
+        The metrics file, opened for reading and left at the end of the last complete line.
+    is_csv : bool
+        Whether the file is CSV rather than JSONL.
+    fieldnames : list, optional
+        The CSV header, once it has been read.
+
+    Returns:
+    --------
+    tuple
+        The new records and the CSV header.
+    """
+    records = []
+    while True:
+        pos = f.tell()
+        line = f.readline()
+        if not line.endswith('\n'):
+            f.seek(pos)  # partially written line, read it next time
+            break
+        if not is_csv:
+            records.append(json.loads(line))
+        elif fieldnames is None:
+            fieldnames = next(csv.reader([line]))
+        else:
+            values = next(csv.reader([line]))
+            records.append({k: float(v) for k, v in zip(fieldnames, values)})
+    return records, fieldnames
+
+
+def _plot_process(path, interval, max_points):
+    """
+    Entry point of the plotter process; matplotlib is only imported here.
+    """
+    from .plot import tail_plot
+    tail_plot(path, interval, max_points)
+
+
+def start_plotter(path=METRICS_FILE, interval=PLOT_INTERVAL, max_points=PLOT_MAX_POINTS):
+    """
+    Starts a separate process that tails the metrics file and plots it.
+
+    Returns:
+    --------
+    multiprocessing.Process
+        The plotter process; it is a daemon and ends with the training process.
+    """
+    process = mp.get_context('spawn').Process(target=_plot_process, args=(path, interval, max_points), daemon=True)
+    process.start()
+    return process
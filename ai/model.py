@@ -1,5 +1,109 @@
 from settings import *
-class Linear_QNet(nn.Module):
+import copy
+import threading
+import warnings
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+import torch.nn.functional as F
+
+def set_threads(num_threads=TORCH_THREADS, interop_threads=TORCH_INTEROP_THREADS):
+    """
+    Sets the number of threads torch uses within an operation and across operations.
+    Small models update fastest with few threads, where the cost of waking a thread pool
+    exceeds the work shared out.
+
+    Parameters:
+    -----------
+    num_threads : int
+        Intra-op threads, 0 to keep the current number.
+    interop_threads : int
+        Inter-op threads, 0 to keep the current number. Torch only accepts this before
+        it has started any parallel work; later it is skipped with a warning.
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads and interop_threads != torch.get_num_interop_threads():
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            warnings.warn(f'inter-op threads left at {torch.get_num_interop_threads()}: {e}')
+
+
+class InputBuffers(threading.local):
+    """
+    Preallocated tensors that the acting and training hot paths copy their NumPy inputs
+    into, instead of allocating new tensors on every call. There is one tensor per input
+    name and shape, e.g. for single moves and for VectorSnakeEnv batches, and each thread
+    has its own set, so the owner can be used from several threads at once.
+
+    Methods:
+    --------
+    put(name, array, dtype=torch.float32):
+        Copies an array into its tensor and returns the tensor.
+    """
+    def __init__(self):
+        self.tensors = {}
+
+    def put(self, name, array, dtype=torch.float32):
+        """
+        Copies an array into the tensor kept for its name and shape, through a NumPy view
+        of that tensor, and returns the tensor. It is overwritten by the next put of the
+        same name and shape on this thread.
+        """
+        array = np.asarray(array)
+        entry = self.tensors.get((name, array.shape))
+        if entry is None or entry[0].dtype != dtype:
+            tensor = torch.empty(array.shape, dtype=dtype)
+            entry = self.tensors[name, array.shape] = (tensor, tensor.numpy())
+        entry[1][...] = array
+        return entry[0]
+
+
+class QNet(nn.Module):
+    """
+    Base class of the Q-networks, which share how their parameters are saved and loaded.
+
+    Methods:
+    --------
+    save(file_name='model.pth'):
+        Saves the model parameters to a file.
+    load(file_name='model.pth'):
+        Loads the model parameters from a file.
+    """
+    def save(self, file_name='model.pth'):
+        """
+        Saves the model parameters to a file.
+
+        Parameters:
+        -----------
+        file_name : str
+            The name of the file where the model parameters will be saved.
+        """
+        model_folder_path =  os.path.join(AI,'model') 
+        if not os.path.exists(model_folder_path):
+            os.makedirs(model_folder_path)
+
+        file_name = os.path.join(model_folder_path, file_name)
+        torch.save(self.state_dict(), file_name)
+
+    def load(self, file_name='model.pth'):
+        """
+        Loads the model parameters saved by save().
+
+        Parameters:
+        -----------
+        file_name : str
+            The file name inside ai/model, or a path to a model file.
+        """
+        if not os.path.exists(file_name):
+            file_name = os.path.join(AI, 'model', file_name)
+        self.load_state_dict(torch.load(file_name, map_location='cpu', weights_only=True))
+        return self
+
+
+class Linear_QNet(QNet):
     """
     A simple feedforward neural network with one hidden layer for Q-learning.
 
@@ -16,6 +120,8 @@ class Linear_QNet(nn.Module):
         Performs a forward pass through the network.
     save(file_name='model.pth'):
         Saves the model parameters to a file.
+    load(file_name='model.pth'):
+        Loads the model parameters from a file.
     """
     def __init__(self, input_size, hidden_size, output_size):
         super().__init__()
@@ -40,21 +146,153 @@ class Linear_QNet(nn.Module):
         x = self.linear2(x)
         return x
 
-    def save(self, file_name='model.pth'):
-        """
+
+class Conv_QNet(QNet):
+    """
+    A small convolutional Q-network for the grid observations of GridEncoder.
+
+    Three 3x3 convolutions, the first two with stride 2, reduce the board 4x in each
+    direction; downsampling first keeps the full-resolution layer, which dominates the
+    cost on CPU, to a single strided pass. An adaptive average pool brings any board size
+    to a fixed 4x4 grid before two linear layers. Inputs may be uint8 images in 0..255, they are scaled in forward().
+
+    Attributes:
+    -----------
+    conv1, conv2, conv3 : torch.nn.Conv2d
+        The convolutions.
+    linear1, linear2 : torch.nn.Linear
+        The hidden and output layers.
+
+    Methods:
+    --------
+    forward(x):
+        Performs a forward pass through the network.
+    save(file_name='model.pth'):
         Saves the model parameters to a file.
+    load(file_name='model.pth'):
+        Loads the model parameters from a file.
+    """
+    def __init__(self, channels, output_size, width=32, hidden_size=256):
+        super().__init__()
+        self.conv1 = nn.Conv2d(channels, width // 2, 3, stride=2, padding=1)
+        self.conv2 = nn.Conv2d(width // 2, width, 3, stride=2, padding=1)
+        self.conv3 = nn.Conv2d(width, width, 3, padding=1)
+        self.pool = nn.AdaptiveAvgPool2d(4)
+        self.linear1 = nn.Linear(width * 16, hidden_size)
+        self.linear2 = nn.Linear(hidden_size, output_size)
+
+    def forward(self, x):
+        """
+        Defines the forward pass through the network.
 
         Parameters:
         -----------
-        file_name : str
-            The name of the file where the model parameters will be saved.
+        x : torch.Tensor
+            (n, channels, rows, cols) or a single (channels, rows, cols) image.
+
+        Returns:
+        --------
+        torch.Tensor
+            (n, output_size) Q values, or (output_size,) for a single image.
         """
-        model_folder_path =  os.path.join(AI,'model') 
-        if not os.path.exists(model_folder_path):
-            os.makedirs(model_folder_path)
+        single = x.dim() == 3
+        if single:
+            x = x.unsqueeze(0)
+        x = x.float() * (1 / 255)
+        x = F.relu(self.conv1(x))
+        x = F.relu(self.conv2(x))
+        x = F.relu(self.conv3(x))
+        x = F.relu(self.linear1(self.pool(x).flatten(1)))
+        x = self.linear2(x)
+        return x[0] if single else x
+
+
+def model_from_state_dict(state_dict):
+    """
+    Rebuilds the Q-network a state dict was saved from, with its layer sizes read from the
+    parameter shapes.
+
+    Returns:
+    --------
+    Linear_QNet or Conv_QNet
+        The model with the parameters loaded, in eval mode.
+    """
+    if 'conv1.weight' in state_dict:
+        channels = state_dict['conv1.weight'].shape[1]
+        width = state_dict['conv2.weight'].shape[0]
+        hidden_size, _ = state_dict['linear1.weight'].shape
+        output_size = state_dict['linear2.weight'].shape[0]
+        model = Conv_QNet(channels, output_size, width, hidden_size)
+    else:
+        hidden_size, input_size = state_dict['linear1.weight'].shape
+        output_size = state_dict['linear2.weight'].shape[0]
+        model = Linear_QNet(input_size, hidden_size, output_size)
+    model.load_state_dict(state_dict)
+    return model.eval()
+
+
+def load_model(path='model.pth'):
+    """
+    Loads a model file written by QNet.save, or the model of a checkpoint directory, as
+    the Linear_QNet or Conv_QNet its parameters come from. Every tool that loads a saved
+    model goes through here.
+
+    Parameters:
+    -----------
+    path : str
+        A model file name in ai/model, a path to one, or a checkpoint directory.
+
+    Returns:
+    --------
+    Linear_QNet or Conv_QNet
+        The model, in eval mode.
+    """
+    if os.path.isdir(path):
+        state_dict = torch.load(os.path.join(path, 'train.pt'), map_location='cpu', weights_only=False)['model']
+    else:
+        if not os.path.exists(path):
+            path = os.path.join(AI, 'model', path)
+        state_dict = torch.load(path, map_location='cpu', weights_only=True)
+    return model_from_state_dict(state_dict)
 
-        file_name = os.path.join(model_folder_path, file_name)
-        torch.save(self.state_dict(), file_name)
+
+def quantize(model):
+    """
+    Returns an int8 copy of a model for inference: the weights of its linear layers are
+    quantized ahead of time and their inputs on each call (dynamic quantization), which
+    makes the weights 4x smaller. The quantized layers only take (n, input) batches.
+    Greedy actions can differ where Q values nearly tie, so check a quantized model's
+    agreement with the float one before deploying it.
+
+    Parameters:
+    -----------
+    model : QNet
+        The float model, left unchanged.
+
+    Returns:
+    --------
+    QNet
+        The quantized copy, in eval mode.
+    """
+    from torch.ao.quantization import quantize_dynamic
+
+    with warnings.catch_warnings():
+        # torch is moving eager mode quantization to the separate torchao package
+        warnings.simplefilter('ignore', DeprecationWarning)
+        warnings.simplefilter('ignore', UserWarning)
+        return quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8).eval()
+
+
+def _adam(params, lr):
+    """
+    Returns an Adam optimizer, fused into a single kernel per step where this torch build
+    supports that on the CPU, which roughly halves the step of a small model.
+    """
+    params = list(params)
+    try:
+        return optim.Adam(params, lr=lr, fused=True)
+    except (RuntimeError, TypeError, ValueError):
+        return optim.Adam(params, lr=lr)
 
 
 class QTrainer:
@@ -69,22 +307,46 @@ class QTrainer:
         Discount factor for future rewards.
     model : nn.Module
         The Q-learning model to be trained.
+    target_model : nn.Module
+        A frozen copy of the model the Bellman targets bootstrap from, or None to
+        bootstrap from the model itself.
+    target_sync : int
+        Updates between hard copies of the model into target_model.
+    tau : float
+        When > 0, target_model is Polyak-averaged towards the model by this much after
+        every update instead of being copied.
+    double : bool
+        Double DQN: the next action is chosen by the model and valued by target_model.
+    updates : int
+        The number of optimizer steps taken.
     optimizer : torch.optim.Optimizer
         The optimizer used for training.
     criterion : torch.nn.MSELoss
-        The loss function used for training.
+        The loss function the training loss is equal to.
 
     Methods:
     --------
     train_step(state, action, reward, next_state, done):
         Performs a single training step.
+    train_batch(state, action, reward, next_state, done, weights=None, n_step=1):
+        Performs a single training step on a batch of tensors.
+    sync_target():
+        Updates target_model after a training step, on the configured cadence.
     """
-    def __init__(self, model, lr, gamma):
+    def __init__(self, model, lr, gamma, target_sync=TARGET_SYNC, tau=TARGET_TAU, double=DOUBLE_DQN):
         self.lr = lr
         self.gamma = gamma
         self.model = model
-        self.optimizer = optim.Adam(model.parameters(), lr=self.lr)
+        self.target_sync = target_sync
+        self.tau = tau
+        self.double = double
+        self.target_model = None
+        if target_sync or tau:
+            self.target_model = copy.deepcopy(model).requires_grad_(False)
+        self.updates = 0
+        self.optimizer = _adam(model.parameters(), self.lr)
         self.criterion = nn.MSELoss()
+        self._inputs = InputBuffers()
 
     def train_step(self, state, action, reward, next_state, done):
         """
@@ -103,36 +365,104 @@ class QTrainer:
         done : list
             Indicates whether the episode is done.
         """
-        state = torch.tensor(state, dtype=torch.float)
-        next_state = torch.tensor(next_state, dtype=torch.float)
-        action = torch.tensor(action, dtype=torch.long)
-        reward = torch.tensor(reward, dtype=torch.float)
+        state = np.asarray(state)
+        next_state = np.asarray(next_state)
+        action = np.asarray(action)
+        reward = np.asarray(reward)
+        done = np.asarray(done)
         # (n, x)
 
-        if len(state.shape) == 1:
-            # (1, x)
-            state = torch.unsqueeze(state, 0)
-            next_state = torch.unsqueeze(next_state, 0)
-            action = torch.unsqueeze(action, 0)
-            reward = torch.unsqueeze(reward, 0)
-            done = (done, )
+        if action.ndim == 1:
+            # (1, x), for a single state of any shape
+            state, next_state, action, reward, done = state[None], next_state[None], action[None], reward[None], done[None]
+
+        # Copied into tensors reused from call to call
+        inputs = self._inputs
+        self.train_batch(inputs.put('state', state), inputs.put('action', action.argmax(axis=1), torch.long),
+                         inputs.put('reward', reward), inputs.put('next_state', next_state),
+                         inputs.put('done', done, torch.bool))
+
+    def train_batch(self, state, action, reward, next_state, done, weights=None, n_step=1):
+        """
+        Performs a single training step on a batch of tensors, e.g. as sampled from a ReplayBuffer.
+
+        Parameters:
+        -----------
+        state : torch.Tensor
+            (n, x) states, of any numeric dtype.
+        action : torch.Tensor
+            (n,) indices of the actions taken.
+        reward : torch.Tensor
+            (n,) rewards received after taking the actions.
+        next_state : torch.Tensor
+            (n, x) next states, of any numeric dtype.
+        done : torch.Tensor
+            (n,) bool flags of the episodes that ended.
+        weights : torch.Tensor, optional
+            (n,) importance-sampling weights applied to each sample's squared error.
+        n_step : int
+            The number of moves the rewards are discounted returns of, as sampled from a
+            ReplayBuffer with that n_step; the next states are bootstrapped with gamma ** n_step.
+
+        Returns:
+        --------
+        torch.Tensor
+            (n,) detached TD errors Q_new - Q(state, action), used as replay priorities.
+        """
+        state = state.float()
+        next_state = next_state.float()
+        action = action.long()
+        reward = reward.float()
+        done = done.bool()
 
         # 1: predicted Q values with current state
         pred = self.model(state)
 
-        target = pred.clone()
-        for idx in range(len(done)):
-            Q_new = reward[idx]
-            if not done[idx]:
-                Q_new = reward[idx] + self.gamma * torch.max(self.model(next_state[idx]))
-
-            target[idx][torch.argmax(action[idx]).item()] = Q_new
-    
-        # 2: Q_new = r + y * max(next_predicted Q value) -> only do this if not done
-        # pred.clone()
-        # preds[argmax(action)] = Q_new
+        # 2: Q_new = r + y^n * max(next_predicted Q value) -> only do this if not done,
+        # computed for the whole batch with one forward pass on next_state
+        Q_new = torch.where(done, reward, reward + self.gamma ** n_step * self._next_value(next_state))
+
+        # The target equals pred except at the actions taken, so the mean squared error over all
+        # of pred is that of the taken actions' Q values summed and divided by pred's size,
+        # without cloning pred into a target
+        q = pred.gather(1, action.unsqueeze(1)).squeeze(1)
+        errors = (Q_new - q) ** 2
+        if weights is not None:
+            errors = weights.float() * errors
+        loss = errors.sum() / pred.numel()
+
         self.optimizer.zero_grad()
-        loss = self.criterion(target, pred)
         loss.backward()
 
-        self.optimizer.step()
\ No newline at end of file
+        self.optimizer.step()
+        self.updates += 1
+        self.sync_target()
+        return (Q_new - q).detach()
+
+    def _next_value(self, next_state):
+        """
+        Returns the value of each next state the Bellman targets bootstrap from: the max Q
+        value of the target network (the model itself without one), or with Double DQN the
+        target network's Q value of the model's greedy action.
+        """
+        target_model = self.model if self.target_model is None else self.target_model
+        if not self.double:
+            return torch.max(target_model(next_state), dim=1)[0]
+        with torch.no_grad():
+            best = torch.argmax(self.model(next_state), dim=1)
+        return target_model(next_state).gather(1, best.unsqueeze(1)).squeeze(1)
+
+    def sync_target(self):
+        """
+        Updates target_model after a training step: a Polyak average every step when tau
+        is set, otherwise a hard copy every target_sync steps.
+        """
+        if self.target_model is None:
+            return
+        if self.tau:
+            with torch.no_grad():
+                for target, param in zip(self.target_model.parameters(), self.model.parameters()):
+                    target.lerp_(param, self.tau)
+        elif self.updates % self.target_sync == 0:
+            self.target_model.load_state_dict(self.model.state_dict())
+
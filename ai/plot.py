@@ -1,16 +1,21 @@
+import os
+import time
 import matplotlib.pyplot as plt
 from IPython import display
+from .metrics import read_metrics
 
 # Enable interactive plotting mode
 plt.ion()
 
-def plot(scores, mean_scores):
+def plot(scores, mean_scores, games=None):
     """
     Plots the scores and mean scores for the training of the Snake game AI.
 
     Parameters:
     scores (list): A list of scores for each game.
     mean_scores (list): A list of mean scores calculated over a window of games.
+    games (list): The game number of each score, when the history is downsampled.
+        Defaults to 0, 1, 2, ...
 
     Returns:
     None
@@ -26,9 +31,12 @@ def plot(scores, mean_scores):
     plt.xlabel('Number of Games', fontsize=14)
     plt.ylabel('Score', fontsize=14)
     
+    if games is None:
+        games = range(len(scores))
+
     # Plot scores and mean scores with thicker lines
-    plt.plot(scores, label='Score per Game', linewidth=2, color='blue')
-    plt.plot(mean_scores, label='Mean Score', linewidth=2, color='orange')
+    plt.plot(games, scores, label='Score per Game', linewidth=2, color='blue')
+    plt.plot(games, mean_scores, label='Mean Score', linewidth=2, color='orange')
     
     # Add grid lines for better readability
     plt.grid(True)
@@ -37,11 +45,11 @@ def plot(scores, mean_scores):
     plt.ylim(ymin=0)
     
     # Annotate the last point of scores and mean scores
-    plt.annotate(f'{scores[-1]}', xy=(len(scores) - 1, scores[-1]), xytext=(len(scores) - 1, scores[-1] + 2),
+    plt.annotate(f'{scores[-1]}', xy=(games[-1], scores[-1]), xytext=(games[-1], scores[-1] + 2),
                  textcoords='offset points', ha='center', fontsize=12, color='blue',
                  bbox=dict(facecolor='white', edgecolor='blue', boxstyle='round,pad=0.5'))
     
-    plt.annotate(f'{mean_scores[-1]}', xy=(len(mean_scores) - 1, mean_scores[-1]), xytext=(len(mean_scores) - 1, mean_scores[-1] + 2),
+    plt.annotate(f'{mean_scores[-1]}', xy=(games[-1], mean_scores[-1]), xytext=(games[-1], mean_scores[-1] + 2),
                  textcoords='offset points', ha='center', fontsize=12, color='orange',
                  bbox=dict(facecolor='white', edgecolor='orange', boxstyle='round,pad=0.5'))
     
@@ -51,3 +59,50 @@ def plot(scores, mean_scores):
     # Show the plot without blocking the execution and pause for a short interval
     plt.show(block=False)
     plt.pause(0.1)
+
+
+def downsample(values, max_points):
+    """
+    Keeps at most about max_points evenly spaced values, always including the last one.
+
+    Parameters:
+    values (list): The full history.
+    max_points (int): The number of points to keep.
+
+    Returns:
+    list: The kept values.
+    """
+    step = max(1, -(-len(values) // max_points))
+    kept = values[::step]
+    if (len(values) - 1) % step:
+        kept.append(values[-1])
+    return kept
+
+
+def tail_plot(path, interval=1.0, max_points=1000):
+    """
+    Follows a metrics file written by MetricsWriter and redraws the training plot
+    whenever new games arrive. Meant to run in its own process (see metrics.start_plotter).
+
+    Parameters:
+    path (str): The JSONL or CSV metrics file.
+    interval (float): Seconds between checks for new records.
+    max_points (int): The history is downsampled to about this many points.
+
+    Returns:
+    None
+    """
+    while not os.path.exists(path):
+        time.sleep(interval)
+
+    records = []
+    fieldnames = None
+    with open(path, newline='') as f:
+        while True:
+            new, fieldnames = read_metrics(f, path.endswith('.csv'), fieldnames)
+            if new:
+                records.extend(new)
+                shown = downsample(records, max_points)
+                plot([r['score'] for r in shown], [round(r['mean_score'], 2) for r in shown],
+                     [r['game'] for r in shown])
+            plt.pause(interval)
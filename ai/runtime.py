@@ -0,0 +1,177 @@
+from settings import *
+import argparse
+import threading
+import time
+import numpy as np
+
+
+# Rows evaluated at a time, so a tile's hidden activations stay in cache between layers
+TILE = 256
+
+
+class _Workspace(threading.local):
+    """
+    The input and hidden activation buffers of one thread, reused across calls for
+    batches of up to len(inputs) states.
+    """
+    def __init__(self):
+        self.inputs = None
+        self.hidden = None
+
+
+class MLPPolicy:
+    """
+    Greedy policy of a Linear_QNet exported by `python -m ai.export`, evaluated with NumPy
+    alone. It imports neither torch nor pygame, so a bot starts in milliseconds; the
+    states are built with ai.state.StateEncoder, as in training.
+
+    The forward pass is fused: the first bias is folded into the first matrix, multiplied
+    by states with a constant 1 appended, and both layers run over tiles of rows so the
+    hidden activations never leave the cache. The buffers are preallocated per thread.
+
+    Attributes:
+    -----------
+    w1, w2 : np.ndarray
+        (input, hidden) and (hidden, output) float32 weights, transposed from the
+        torch layout so a batch of states multiplies them directly.
+    b1, b2 : np.ndarray
+        (hidden,) and (output,) float32 biases.
+    tile : int
+        The rows evaluated at a time.
+
+    Methods:
+    --------
+    from_model(model):
+        Builds the policy of a loaded Linear_QNet.
+    q_values(states):
+        Returns the Q values of one state or a batch of states.
+    act(state):
+        Returns the greedy action index for one state.
+    act_batch(states):
+        Returns the greedy action indices for a batch of states.
+    """
+    def __init__(self, weights='model.npz', tile=TILE):
+        """
+        Parameters:
+        -----------
+        weights : str or dict
+            An .npz file written by ai.export, in ai/model or a path, or a mapping of the
+            same names (a Linear_QNet state dict) to NumPy arrays.
+        tile : int
+            The rows evaluated at a time.
+        """
+        if isinstance(weights, str):
+            if not os.path.exists(weights):
+                weights = os.path.join(AI, 'model', weights)
+            with np.load(weights) as f:
+                weights = dict(f)
+        if 'conv1.weight' in weights:
+            raise ValueError('the NumPy runtime only runs Linear_QNet models, not Conv_QNet '
+                             '(export convolutional models to TorchScript with python -m ai.export)')
+        self.w1 = np.ascontiguousarray(weights['linear1.weight'].T, dtype=np.float32)
+        self.b1 = np.asarray(weights['linear1.bias'], dtype=np.float32)
+        self.w2 = np.ascontiguousarray(weights['linear2.weight'].T, dtype=np.float32)
+        self.b2 = np.asarray(weights['linear2.bias'], dtype=np.float32)
+        self.tile = tile
+        self._w1b = np.vstack([self.w1, self.b1])  # the first layer with its bias as the last row
+        self._workspace = _Workspace()
+
+    @classmethod
+    def from_model(cls, model, tile=TILE):
+        """
+        Builds the policy of a Linear_QNet, e.g. one returned by ai.model.load_model,
+        without writing it to a file. Raises ValueError for other models.
+        """
+        return cls({name: p.numpy() for name, p in model.state_dict().items()}, tile)
+
+    @property
+    def input_size(self):
+        """The number of features of a state."""
+        return self.w1.shape[0]
+
+    def q_values(self, states):
+        """
+        Returns the Q values [straight, right, left] of a (input,) state or an (n, input)
+        batch, as Linear_QNet.forward does.
+        """
+        states = np.asarray(states)
+        if states.ndim == 1:  # too small to gain from the buffers
+            hidden = states.astype(np.float32) @ self.w1
+            hidden += self.b1
+            np.maximum(hidden, 0, out=hidden)
+            q = hidden @ self.w2
+            q += self.b2
+            return q
+
+        n = len(states)
+        ws = self._workspace
+        if ws.inputs is None or len(ws.inputs) < n:
+            ws.inputs = np.ones((max(n, self.tile), self._w1b.shape[0]), dtype=np.float32)
+            ws.hidden = np.empty((self.tile, self.w1.shape[1]), dtype=np.float32)
+        inputs = ws.inputs[:n]
+        inputs[:, :-1] = states  # converts to float32; the last column stays 1
+        if n <= self.tile:
+            hidden = np.matmul(inputs, self._w1b, out=ws.hidden[:n])
+            np.maximum(hidden, 0, out=hidden)
+            q = hidden @ self.w2
+        else:
+            q = np.empty((n, self.w2.shape[1]), dtype=np.float32)
+            for start in range(0, n, self.tile):
+                end = min(start + self.tile, n)
+                hidden = ws.hidden[:end - start]
+                np.matmul(inputs[start:end], self._w1b, out=hidden)
+                np.maximum(hidden, 0, out=hidden)
+                np.matmul(hidden, self.w2, out=q[start:end])
+        q += self.b2
+        return q
+
+    def act(self, state):
+        """Returns the greedy action index (0 straight, 1 right, 2 left) for one state."""
+        return int(np.argmax(self.q_values(state)))
+
+    def act_batch(self, states):
+        """Returns the (n,) greedy action indices for an (n, input) batch of states."""
+        return np.argmax(self.q_values(states), axis=1)
+
+
+def play(path='model.npz', games=10, cols=COLS, rows=ROWS, seed=0):
+    """
+    Plays greedy headless games with an exported policy, without torch.
+
+    Returns:
+    --------
+    list
+        The score of each game.
+    """
+    from .snake_ai import SnakeGameAI
+    from .state import StateEncoder, STATE_SIZE
+
+    policy = MLPPolicy(path)
+    encoder = StateEncoder()
+    if policy.input_size != STATE_SIZE:
+        raise ValueError(f'{path} takes {policy.input_size} features, games give {STATE_SIZE} (frame-stacked models are not supported)')
+    game = SnakeGameAI(True, cols, rows)
+    rng = np.random.default_rng(seed)
+    action = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+    scores = []
+    game.reset(int(rng.integers(2 ** 32)))
+    while len(scores) < games:
+        _, done, score = game.play_step(action[policy.act(encoder.encode(game))])
+        if done:
+            scores.append(score)
+            game.reset(int(rng.integers(2 ** 32)))
+    return scores
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m ai.runtime', description='Play greedy games with an exported policy, without torch')
+    parser.add_argument('model', nargs='?', default='model.npz', help='weights written by python -m ai.export, in ai/model or a path')
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cols', type=int, default=COLS)
+    parser.add_argument('--rows', type=int, default=ROWS)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    scores = play(args.model, args.games, args.cols, args.rows, args.seed)
+    print(f'{len(scores)} games in {time.perf_counter() - start:.2f} s, mean score {np.mean(scores):.2f}, '
+          f'max score {max(scores)}')
@@ -1,21 +1,26 @@
 from settings import *
+from api.recording import EpisodeWriter
+import numpy as np
+
+pg = None  # pygame, imported by _init_display so headless games never load it
 
 class SnakeGameAI:
     """
     A class to represent the Snake Game with AI.
 
-    ...
+    The head, body and food are integer cell coordinates; they are scaled to pixels
+    only when drawn by _update_ui, through api.render.Renderer.
 
     Methods
     -------
-    __init__():
-        Initializes the game by setting up the display, font, and initial state.
+    __init__(headless=False, cols=COLS, rows=ROWS):
+        Initializes a game on a cols x rows board, opening a display unless running headless.
 
-    reset():
-        Resets the game to its initial state.
+    reset(seed=None):
+        Resets the game to its initial state, with its own food generator seeded by `seed`.
 
     _place_food():
-        Places the food in a random position on the grid.
+        Places the food on a random free cell, or marks the game as won when the board is full.
 
     play_step(action):
         Executes one step of the game based on the provided action.
@@ -28,44 +33,108 @@ class SnakeGameAI:
 
     _move(action):
         Moves the snake in the specified direction based on the action taken.
+
+    close():
+        Writes the episode being recorded, if any, and closes the log.
     """
 
-    def __init__(self):
+    def __init__(self, headless=False, cols=COLS, rows=ROWS, record=None):
         """
         Initializes the SnakeGameAI class, setting up the display, font, and initial game state.
+
+        Parameters:
+        headless (bool): When True no window is opened, no events are polled and
+            the frame rate is not limited. Rendering can still be switched on
+            later through the `render` attribute.
+        cols (int): The board width in cells (at least 4).
+        rows (int): The board height in cells.
+        record (str): When given, every episode is appended to this episode log
+            (see api.recording) and can be replayed with python -m ai.episodes.
+        """
+        self.cols = cols
+        self.rows = rows
+        self.width = cols * BLOCK_SIZE
+        self.height = rows * BLOCK_SIZE
+        self.fps = FPS
+        self.frame_limit = 100  # a game ends after frame_limit * (len(snake) + 1) frames, None for no limit
+        self.recorder = EpisodeWriter(record) if record else None
+        self.display = None
+        self._render = not headless
+        if self._render:
+            self._init_display()
+        self.reset()
+
+    @property
+    def render(self):
+        """
+        Whether each step is drawn. Turning it off closes the window, which would otherwise
+        stay open with nobody polling its events; the next rendered step opens it again.
+        """
+        return self._render
+
+    @render.setter
+    def render(self, render):
+        self._render = render
+        if not render and self.display is not None:
+            pg.display.quit()
+            self.display = None
+
+    def _init_display(self):
         """
+        Opens the game window, font, renderer and clock. Called lazily the first time a headless game is rendered.
+        """
+        global pg
+        import pygame as pg
+        from api.render import Renderer
         pg.init()
         self.font = pg.font.SysFont("Arial", 24, bold=True)
-        self.display = pg.display.set_mode(RES)
+        self.display = pg.display.set_mode((self.width, self.height))
         pg.display.set_caption('Snake')
+        self.renderer = Renderer(self.display, self.font)
         self.clock = pg.time.Clock()
-        self.reset()
 
-    def reset(self):
+    def reset(self, seed=None):
         """
         Resets the game to its initial state, including the snake's position, direction, score, and food placement.
+
+        Parameters:
+        seed (int): Seeds the game's own food generator, so the episode can be replayed
+            from its seed and actions. Drawn from the `random` module by default.
         """
+        if self.recorder is not None and self.recorder.recording:
+            self.recorder.end(self.score)
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        if self.recorder is not None:
+            self.recorder.begin(self.seed, self.cols, self.rows)
         self.direction = Direction.RIGHT
-        self.head = Point(WIDTH / 2, HEIGHT / 2)
-        self.snake = [
+        self.head = Point(self.cols // 2, self.rows // 2)
+        # Head first; the board mirrors the body for O(1) collision checks
+        self.snake = deque([
             self.head,
-            Point(self.head.x - BLOCK_SIZE, self.head.y),
-            Point(self.head.x - (2 * BLOCK_SIZE), self.head.y)
-        ]
+            Point(self.head.x - 1, self.head.y),
+            Point(self.head.x - 2, self.head.y)
+        ])
+        self.board = Board(self.cols, self.rows)
+        for pt in self.snake:
+            self.board.add(pt)
         self.score = 0
         self.food = None
+        self.won = False
+        self.end_reason = None  # 'wall', 'self', 'timeout' or 'win' once the game is over
         self._place_food()
         self.frame_iteration = 0
 
     def _place_food(self):
         """
-        Places the food in a random position on the grid, ensuring it does not overlap with the snake.
+        Places the food on a uniformly random free cell. When the snake covers the whole
+        board there is nowhere left to place it and the game is won.
         """
-        x = random.randint(0, (WIDTH - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        y = random.randint(0, (HEIGHT - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        self.food = Point(x, y)
-        if self.food in self.snake:
-            self._place_food()
+        food = self.board.random_free(self.rng)
+        if food is None:
+            self.won = True
+        else:
+            self.food = food
 
     def play_step(self, action):
         """
@@ -80,34 +149,51 @@ class SnakeGameAI:
         self.frame_iteration += 1
 
         # 1. Collect user input
-        for event in pg.event.get():
-            if event.type == pg.QUIT:
-                pg.quit()
-                quit()
+        if self._render:
+            if self.display is None:
+                self._init_display()
+            for event in pg.event.get():
+                if event.type == pg.QUIT:
+                    pg.quit()
+                    quit()
 
         # 2. Move
         self._move(action)
-        self.snake.insert(0, self.head)
+        if self.recorder is not None:
+            self.recorder.step(self.direction)
 
-        # 3. Check if game over
+        # 3. Check if game over (the new head is checked against the body before it is added)
         reward = 0
         game_over = False
-        if self.is_collision() or self.frame_iteration > 100 * len(self.snake):
+        if self.is_collision() or (self.frame_limit and self.frame_iteration > self.frame_limit * (len(self.snake) + 1)):
             game_over = True
             reward = -10
+            if not self.board.in_bounds(self.head):
+                self.end_reason = 'wall'
+            elif self.is_collision():
+                self.end_reason = 'self'
+            else:
+                self.end_reason = 'timeout'
             return reward, game_over, self.score
+        self.snake.appendleft(self.head)
+        self.board.add(self.head)
 
         # 4. Place new food or just move
         if self.head == self.food:
             self.score += 1
             reward = 10
             self._place_food()
+            if self.won:
+                game_over = True
+                self.end_reason = 'win'
+                return reward, game_over, self.score
         else:
-            self.snake.pop()
+            self.board.remove(self.snake.pop())
 
         # 5. Update UI and clock
-        self._update_ui()
-        self.clock.tick(FPS)
+        if self._render:
+            self._update_ui()
+            self.clock.tick(self.fps)
 
         # 6. Return reward, game over and score
         return reward, game_over, self.score
@@ -117,7 +203,7 @@ class SnakeGameAI:
         Checks if the given point (or the head) collides with the boundaries or itself.
 
         Parameters:
-        pt (Point): The point to check for collision. Defaults to the snake's head.
+        pt (Point): The cell to check for collision. Defaults to the snake's head.
 
         Returns:
         bool: True if a collision is detected, False otherwise.
@@ -125,26 +211,29 @@ class SnakeGameAI:
         if pt is None:
             pt = self.head
         # Hits boundary
-        if pt.x > WIDTH - BLOCK_SIZE or pt.x < 0 or pt.y > HEIGHT - BLOCK_SIZE or pt.y < 0:
+        if pt.x >= self.cols or pt.x < 0 or pt.y >= self.rows or pt.y < 0:
             return True
-        # Hits itself
-        if pt in self.snake[1:]:
+        # Hits itself (any segment behind the current head)
+        if pt in self.board and pt != self.snake[0]:
             return True
         return False
 
     def _update_ui(self):
         """
         Updates the game display and UI elements, such as the snake, food, and score.
+        Only the cells that changed since the previous frame are redrawn, see Renderer.
         """
-        self.display.fill(BLACK)
-        for pt in self.snake:
-            pg.draw.rect(self.display, BLUE1, pg.Rect(pt.x, pt.y, BLOCK_SIZE, BLOCK_SIZE))
-            pg.draw.rect(self.display, BLUE2, pg.Rect(pt.x + 4, pt.y + 4, 12, 12))
-        pg.draw.rect(self.display, RED, pg.Rect(self.food.x, self.food.y, BLOCK_SIZE, BLOCK_SIZE))
+        self.renderer.draw(self)
 
-        text = self.font.render("Score: " + str(self.score), True, WHITE)
-        self.display.blit(text, [0, 0])
-        pg.display.flip()
+    def close(self):
+        """
+        Writes the episode being recorded, if any, and closes the episode log.
+        """
+        if self.recorder is not None:
+            if self.recorder.recording:
+                self.recorder.end(self.score)
+            self.recorder.close()
+            self.recorder = None
 
     def _move(self, action):
         """
@@ -170,13 +259,13 @@ class SnakeGameAI:
         x = self.head.x
         y = self.head.y
         if self.direction == Direction.RIGHT:
-            x += BLOCK_SIZE
+            x += 1
         elif self.direction == Direction.LEFT:
-            x -= BLOCK_SIZE
+            x -= 1
         elif self.direction == Direction.DOWN:
-            y += BLOCK_SIZE
+            y += 1
         elif self.direction == Direction.UP:
-            y -= BLOCK_SIZE
+            y -= 1
 
         self.head = Point(x, y)
 
@@ -0,0 +1,251 @@
+from settings import *
+import numpy as np
+
+# Directions in the clockwise order used by SnakeGameAI._move, and their moves in cells
+CLOCK_WISE = [Direction.RIGHT, Direction.DOWN, Direction.LEFT, Direction.UP]
+DIR_INDEX = {d: i for i, d in enumerate(CLOCK_WISE)}
+MOVES = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+
+# For each direction: the cells checked for danger straight, right and left of the head
+DANGER_MOVES = [[MOVES[d], MOVES[(d + 1) % 4], MOVES[(d - 1) % 4]] for d in range(4)]
+DANGER_DX = np.array([[dx for dx, _ in moves] for moves in DANGER_MOVES], dtype=np.int64)
+DANGER_DY = np.array([[dy for _, dy in moves] for moves in DANGER_MOVES], dtype=np.int64)
+
+# For each direction: the move direction features [left, right, up, down]
+DIR_FEATURES = [bytes([d == Direction.LEFT, d == Direction.RIGHT, d == Direction.UP, d == Direction.DOWN])
+                for d in CLOCK_WISE]
+DIR_FEATURES_ARRAY = np.frombuffer(b''.join(DIR_FEATURES), dtype=np.uint8).reshape(4, 4)
+
+STATE_SIZE = 11
+
+
+class StateEncoder:
+    """
+    Builds the 11 feature state of Agent.get_state without intermediate Points or lists.
+
+    The features are, in order: danger straight, right and left; move direction left,
+    right, up and down; food left, right, up and down. Dangers are read from the game's
+    occupancy grid and the relative-direction lookup tables above, and the features are
+    written into a preallocated buffer.
+
+    Attributes:
+    -----------
+    shape : tuple
+        The shape of one state, (11,).
+    buffer : np.ndarray
+        (11,) uint8 view of the buffer encode() writes into; it is overwritten by each call.
+
+    Methods:
+    --------
+    encode(game, out=None):
+        Encodes one SnakeGameAI.
+    encode_batch(env, out=None):
+        Encodes every game of a VectorSnakeEnv.
+    """
+    shape = (STATE_SIZE,)
+
+    def __init__(self):
+        self._bytes = bytearray(STATE_SIZE)
+        self.buffer = np.frombuffer(self._bytes, dtype=np.uint8)
+        self._batch = None
+
+    def encode(self, game, out=None):
+        """
+        Encodes the state of one game.
+
+        Parameters:
+        -----------
+        game : SnakeGameAI
+            The game to encode.
+        out : np.ndarray, optional
+            (11,) array to copy the features into, e.g. a row of a replay chunk.
+
+        Returns:
+        --------
+        np.ndarray
+            `out` if given, otherwise `buffer`, which the next call overwrites.
+        """
+        b = self._bytes
+        board = game.board
+        cols, rows, cells = board.cols, board.rows, board.cells
+        head, food = game.head, game.food
+        hx, hy = head
+        d = DIR_INDEX[game.direction]
+
+        # Danger straight, right and left
+        for i, (dx, dy) in enumerate(DANGER_MOVES[d]):
+            x = hx + dx
+            y = hy + dy
+            b[i] = not (0 <= x < cols and 0 <= y < rows) or cells[y * cols + x]
+
+        # Move direction
+        b[3:7] = DIR_FEATURES[d]
+
+        # Food location
+        b[7] = food.x < head.x  # food left
+        b[8] = food.x > head.x  # food right
+        b[9] = food.y < head.y  # food up
+        b[10] = food.y > head.y  # food down
+
+        if out is None:
+            return self.buffer
+        out[:] = self.buffer
+        return out
+
+    def encode_batch(self, env, out=None):
+        """
+        Encodes the states of every game of a VectorSnakeEnv at once.
+
+        Parameters:
+        -----------
+        env : VectorSnakeEnv
+            The games to encode.
+        out : np.ndarray, optional
+            (K, 11) array to write into. Defaults to a buffer reused between calls.
+
+        Returns:
+        --------
+        np.ndarray
+            (K, 11) uint8 states.
+        """
+        if out is None:
+            if self._batch is None or len(self._batch) != env.num_envs:
+                self._batch = np.empty((env.num_envs, STATE_SIZE), dtype=np.uint8)
+            out = self._batch
+
+        hx, hy = env.heads[:, 0], env.heads[:, 1]
+        d = env.directions
+
+        # Danger straight, right and left
+        x = hx[:, None] + DANGER_DX[d]
+        y = hy[:, None] + DANGER_DY[d]
+        outside = (x < 0) | (x >= env.cols) | (y < 0) | (y >= env.rows)
+        cells = y.clip(0, env.rows - 1) * env.cols + x.clip(0, env.cols - 1)
+        body = np.take_along_axis(env.grid.reshape(env.num_envs, -1), cells, axis=1)
+        out[:, 0:3] = outside | body
+
+        # Move direction
+        out[:, 3:7] = DIR_FEATURES_ARRAY[d]
+
+        # Food location
+        out[:, 7] = env.food[:, 0] < hx
+        out[:, 8] = env.food[:, 0] > hx
+        out[:, 9] = env.food[:, 1] < hy
+        out[:, 10] = env.food[:, 1] > hy
+        return out
+
+
+class GridEncoder:
+    """
+    Builds a multi-channel image of the board, so the model sees its whole body rather
+    than only the danger of the three cells around the head.
+
+    The channels are, in order: body (the game's occupancy grid, head included), head,
+    food and, optionally, the body age, 255 at the head falling to 255 / len(snake) at the
+    tail, which tells the model which way the body will clear. Cells are 0 or 255, uint8.
+
+    Attributes:
+    -----------
+    cols, rows : int
+        The board size in cells.
+    age : bool
+        Whether the body age channel is included.
+    shape : tuple
+        The shape of one state, (channels, rows, cols).
+    buffer : np.ndarray
+        The array encode() writes into; it is overwritten by each call.
+
+    Methods:
+    --------
+    encode(game, out=None):
+        Encodes one SnakeGameAI.
+    encode_batch(env, out=None):
+        Encodes every game of a VectorSnakeEnv.
+    """
+    def __init__(self, cols=COLS, rows=ROWS, age=False):
+        self.cols = cols
+        self.rows = rows
+        self.age = age
+        self.shape = (4 if age else 3, rows, cols)
+        self.buffer = np.zeros(self.shape, dtype=np.uint8)
+        self._batch = None
+
+    def encode(self, game, out=None):
+        """
+        Encodes the board of one game.
+
+        Parameters:
+        -----------
+        game : SnakeGameAI
+            The game to encode; its board must be cols x rows.
+        out : np.ndarray, optional
+            Array of `shape` to write into, e.g. a row of a replay chunk.
+
+        Returns:
+        --------
+        np.ndarray
+            `out` if given, otherwise `buffer`, which the next call overwrites.
+        """
+        if out is None:
+            out = self.buffer
+        # The occupancy bytes are read in place, without a copy into Python objects
+        cells = np.frombuffer(game.board.cells, dtype=np.uint8).reshape(self.rows, self.cols)
+        np.multiply(cells, 255, out=out[0])
+        out[1:3] = 0
+        head, food = game.snake[0], game.food
+        out[1, head.y, head.x] = 255
+        out[2, food.y, food.x] = 255
+        if self.age:
+            n = len(game.snake)
+            out[3] = 0
+            xs = [pt.x for pt in game.snake]
+            ys = [pt.y for pt in game.snake]
+            out[3, ys, xs] = 255 * np.arange(n, 0, -1) // n
+        return out
+
+    def encode_batch(self, env, out=None):
+        """
+        Encodes the boards of every game of a VectorSnakeEnv at once.
+
+        Parameters:
+        -----------
+        env : VectorSnakeEnv
+            The games to encode; their boards must be cols x rows.
+        out : np.ndarray, optional
+            (K, *shape) array to write into. Defaults to a buffer reused between calls.
+
+        Returns:
+        --------
+        np.ndarray
+            (K, *shape) uint8 states.
+        """
+        k = env.num_envs
+        if out is None:
+            if self._batch is None or len(self._batch) != k:
+                self._batch = np.empty((k, *self.shape), dtype=np.uint8)
+            out = self._batch
+        np.multiply(env.grid, 255, out=out[:, 0], casting='unsafe')
+        out[:, 1:3] = 0
+        out[env._all, 1, env.heads[:, 1], env.heads[:, 0]] = 255
+        out[env._all, 2, env.food[:, 1], env.food[:, 0]] = 255
+        if self.age:
+            # Ring slot j holds the segment (head_ptr - j) % n_cells steps behind the head
+            behind = (env.head_ptr[:, None] - np.arange(env.n_cells)) % env.n_cells
+            alive = behind < env.lengths[:, None]
+            envs, slots = np.nonzero(alive)
+            ages = 255 * (env.lengths[envs] - behind[envs, slots]) // env.lengths[envs]
+            cells = env.body[envs, slots]
+            out[:, 3] = 0
+            out[envs, 3, cells // env.cols, cells % env.cols] = ages
+        return out
+
+
+def make_encoder(observation=OBSERVATION, cols=COLS, rows=ROWS):
+    """
+    Returns the encoder of an observation mode: 'features', 'grid' or 'grid_age'.
+    """
+    if observation == 'features':
+        return StateEncoder()
+    if observation in ('grid', 'grid_age'):
+        return GridEncoder(cols, rows, age=observation == 'grid_age')
+    raise ValueError(f'unknown observation {observation!r}')
@@ -0,0 +1,190 @@
+from settings import *
+from .state import StateEncoder, STATE_SIZE
+import numpy as np
+
+# Moves in the clockwise direction order used by SnakeGameAI._move: RIGHT, DOWN, LEFT, UP
+DX = np.array([1, 0, -1, 0], dtype=np.int64)
+DY = np.array([0, 1, 0, -1], dtype=np.int64)
+
+# Direction change for the actions [straight, right, left]
+TURN = np.array([0, 1, -1], dtype=np.int64)
+
+
+class VectorSnakeEnv:
+    """
+    Runs K snake games in lockstep with the whole state held in NumPy arrays.
+
+    The rules are the same as SnakeGameAI.play_step: the head moves one cell per step,
+    hitting a wall or any body segment (including the tail that is about to move) ends
+    the game, so does running for more than 100 * len(snake) frames, eating food gives
+    +10 and dying gives -10. Finished games are reset automatically inside step().
+
+    Positions are (x, y) grid cells, as in SnakeGameAI, and cells are packed into
+    flat indices y * cols + x for the body ring buffers.
+
+    Attributes:
+    -----------
+    num_envs : int
+        The number of games K stepped together.
+    cols, rows : int
+        The board size in cells.
+    heads : np.ndarray
+        (K, 2) head positions as (x, y) cells.
+    directions : np.ndarray
+        (K,) index of the current direction in the order RIGHT, DOWN, LEFT, UP.
+    grid : np.ndarray
+        (K, rows, cols) boolean occupancy grid of the snake bodies.
+    body : np.ndarray
+        (K, rows * cols) ring buffers of flat cell indices, body[k, head_ptr[k]] is the head.
+    head_ptr : np.ndarray
+        (K,) position of the head in the ring buffer.
+    lengths : np.ndarray
+        (K,) length of each snake.
+    food : np.ndarray
+        (K, 2) food positions as (x, y) cells.
+    scores : np.ndarray
+        (K,) score of each running game.
+    frames : np.ndarray
+        (K,) frame counter of each running game.
+
+    Methods:
+    --------
+    reset(idx=None):
+        Resets the given games (all games by default).
+    step(actions):
+        Advances every game by one move.
+    observe():
+        Returns the 11 feature state of every game, as built by Agent.get_state.
+    """
+    def __init__(self, num_envs, cols=COLS, rows=ROWS, seed=None):
+        self.num_envs = num_envs
+        self.cols = cols
+        self.rows = rows
+        self.n_cells = cols * rows
+        self.rng = np.random.default_rng(seed)
+        self._all = np.arange(num_envs)
+
+        self.heads = np.zeros((num_envs, 2), dtype=np.int64)
+        self.directions = np.zeros(num_envs, dtype=np.int64)
+        self.grid = np.zeros((num_envs, rows, cols), dtype=bool)
+        self.body = np.zeros((num_envs, self.n_cells), dtype=np.int64)
+        self.head_ptr = np.zeros(num_envs, dtype=np.int64)
+        self.lengths = np.zeros(num_envs, dtype=np.int64)
+        self.food = np.zeros((num_envs, 2), dtype=np.int64)
+        self.scores = np.zeros(num_envs, dtype=np.int64)
+        self.frames = np.zeros(num_envs, dtype=np.int64)
+        self.encoder = StateEncoder()
+        self.reset()
+
+    def reset(self, idx=None):
+        """
+        Resets the given games to the starting position of SnakeGameAI.reset.
+
+        Parameters:
+        -----------
+        idx : np.ndarray, optional
+            Indices of the games to reset. Defaults to all games.
+        """
+        if idx is None:
+            idx = self._all
+        if len(idx) == 0:
+            return
+
+        x, y = self.cols // 2, self.rows // 2
+        self.grid[idx] = False
+        self.grid[idx, y, x - 2:x + 1] = True
+        self.body[idx, 0] = y * self.cols + x - 2
+        self.body[idx, 1] = y * self.cols + x - 1
+        self.body[idx, 2] = y * self.cols + x
+        self.head_ptr[idx] = 2
+        self.lengths[idx] = 3
+        self.heads[idx] = (x, y)
+        self.directions[idx] = 0  # RIGHT
+        self.scores[idx] = 0
+        self.frames[idx] = 0
+        self._place_food(idx)
+
+    def _place_food(self, idx):
+        """
+        Places food uniformly at random on a free cell of each of the given games.
+        """
+        free = ~self.grid[idx].reshape(len(idx), self.n_cells)
+        keys = self.rng.random(free.shape)
+        keys[~free] = -1.0
+        cell = np.argmax(keys, axis=1)
+        self.food[idx, 0] = cell % self.cols
+        self.food[idx, 1] = cell // self.cols
+
+    def step(self, actions):
+        """
+        Advances every game by one move and resets the games that finished.
+
+        Parameters:
+        -----------
+        actions : np.ndarray
+            Either (K,) action indices or (K, 3) one-hot actions [straight, right, left].
+
+        Returns:
+        --------
+        tuple
+            rewards (K,) float32, dones (K,) bool and scores (K,) int64. The scores are
+            those reached before the auto-reset, so finished games report their final score.
+        """
+        actions = np.asarray(actions)
+        if actions.ndim == 2:
+            actions = actions.argmax(axis=1)
+
+        self.directions = (self.directions + TURN[actions]) % 4
+        x = self.heads[:, 0] + DX[self.directions]
+        y = self.heads[:, 1] + DY[self.directions]
+        self.frames += 1
+
+        out = (x < 0) | (x >= self.cols) | (y < 0) | (y >= self.rows)
+        hit_self = self.grid[self._all, y.clip(0, self.rows - 1), x.clip(0, self.cols - 1)] & ~out
+        timeout = self.frames > 100 * (self.lengths + 1)
+        dones = out | hit_self | timeout
+        rewards = np.where(dones, -10.0, 0.0).astype(np.float32)
+
+        alive = np.flatnonzero(~dones)
+        ax, ay = x[alive], y[alive]
+        self.heads[alive, 0] = ax
+        self.heads[alive, 1] = ay
+        self.head_ptr[alive] = (self.head_ptr[alive] + 1) % self.n_cells
+        self.body[alive, self.head_ptr[alive]] = ay * self.cols + ax
+        self.grid[alive, ay, ax] = True
+
+        ate = (ax == self.food[alive, 0]) & (ay == self.food[alive, 1])
+        grew = alive[ate]
+        moved = alive[~ate]
+
+        tail = self.body[moved, (self.head_ptr[moved] - self.lengths[moved]) % self.n_cells]
+        self.grid[moved, tail // self.cols, tail % self.cols] = False
+
+        self.lengths[grew] += 1
+        self.scores[grew] += 1
+        rewards[grew] = 10.0
+        won = grew[self.lengths[grew] == self.n_cells]
+        dones[won] = True
+        self._place_food(grew[self.lengths[grew] < self.n_cells])
+
+        scores = self.scores.copy()
+        self.reset(np.flatnonzero(dones))
+        return rewards, dones, scores
+
+    def observe(self, out=None):
+        """
+        Returns the state of every game, feature for feature as built by Agent.get_state.
+
+        Parameters:
+        -----------
+        out : np.ndarray, optional
+            (K, 11) uint8 array to write the states into. A new array is returned otherwise.
+
+        Returns:
+        --------
+        np.ndarray
+            (K, 11) uint8 array of states.
+        """
+        if out is None:
+            out = np.empty((self.num_envs, STATE_SIZE), dtype=np.uint8)
+        return self.encoder.encode_batch(self, out)
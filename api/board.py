@@ -0,0 +1,81 @@
+import random
+
+from api.direction import Point
+
+
+class Board:
+    """
+    An occupancy grid of the cells covered by the snake's body, with an index of the free cells.
+
+    Points are integer cell coordinates, as used by the games; cell (x, y) is packed
+    into the flat index y * cols + x. Membership tests, adds, removes and drawing a
+    uniformly random free cell are all O(1) regardless of the snake's length.
+
+    Attributes:
+    cols (int): The number of cells along x.
+    rows (int): The number of cells along y.
+    cells (bytearray): One byte per cell, 1 when the cell is covered by the body.
+    free (list): The flat indices of the free cells, in no particular order.
+    slot (list): The position of each cell in `free`, or -1 when the cell is covered.
+    """
+
+    def __init__(self, cols, rows):
+        self.cols = cols
+        self.rows = rows
+        self.clear()
+
+    def index(self, pt):
+        """Return the flat cell index of an in-bounds point."""
+        return pt.y * self.cols + pt.x
+
+    def point(self, index):
+        """Return the cell point of a flat cell index."""
+        return Point(index % self.cols, index // self.cols)
+
+    def in_bounds(self, pt):
+        """Return True if the point lies on the board."""
+        return 0 <= pt.x < self.cols and 0 <= pt.y < self.rows
+
+    def add(self, pt):
+        """Mark the cell of the point as covered, swapping it out of the free index."""
+        i = self.index(pt)
+        self.cells[i] = 1
+        pos = self.slot[i]
+        last = self.free.pop()
+        if last != i:
+            self.free[pos] = last
+            self.slot[last] = pos
+        self.slot[i] = -1
+
+    def remove(self, pt):
+        """Mark the cell of the point as free, appending it to the free index."""
+        i = self.index(pt)
+        self.cells[i] = 0
+        self.slot[i] = len(self.free)
+        self.free.append(i)
+
+    def clear(self):
+        """Mark every cell as free."""
+        n = self.cols * self.rows
+        self.cells = bytearray(n)
+        self.free = list(range(n))
+        self.slot = list(range(n))
+
+    @property
+    def full(self):
+        """True when the body covers every cell."""
+        return not self.free
+
+    def random_free(self, rng=random):
+        """
+        Return a uniformly random free cell as a point, or None when the board is full.
+
+        Parameters:
+        rng (random.Random): The random source, the `random` module by default.
+        """
+        if not self.free:
+            return None
+        return self.point(self.free[rng.randrange(len(self.free))])
+
+    def __contains__(self, pt):
+        return self.in_bounds(pt) and self.cells[self.index(pt)] == 1
@@ -0,0 +1,128 @@
+import os
+import struct
+from collections import namedtuple
+
+from api.direction import Direction
+
+# Action bytes are the direction moved on each step, in clockwise order
+DIRECTIONS = [Direction.RIGHT, Direction.DOWN, Direction.LEFT, Direction.UP]
+DIR_INDEX = {d: i for i, d in enumerate(DIRECTIONS)}
+
+MAGIC = b'SNAKEREC'
+VERSION = 1
+FILE_HEADER = struct.Struct('<8sB')
+# seed, cols, rows, flags, final score, number of steps
+EPISODE_HEADER = struct.Struct('<IHHBII')
+HUMAN = 1  # flag: played in game.snake, which has no frame limit
+
+Episode = namedtuple('Episode', 'seed cols rows human score actions')
+"""
+One recorded episode.
+
+Attributes:
+seed (int): The seed of the game's food generator.
+cols, rows (int): The board size; with the seed they fix the initial state, since a game
+    always starts with a 3 cell snake in the middle heading right.
+human (bool): Whether it was played in game.snake rather than SnakeGameAI.
+score (int): The final score.
+actions (np.ndarray): One uint8 per step, the index in DIRECTIONS of the direction moved.
+"""
+
+
+class EpisodeWriter:
+    """
+    Appends episodes to a binary log: a file header, then per episode a fixed-size header
+    (seed, board size, flags, score, steps) followed by one action byte per step.
+
+    Attributes:
+    path (str): The log file.
+    recording (bool): True between begin() and end().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self._actions = None
+        self._header = None
+
+    @property
+    def recording(self):
+        return self._actions is not None
+
+    def begin(self, seed, cols, rows, human=False):
+        """Start a new episode; the one in progress, if any, should be ended first."""
+        self._header = (seed, cols, rows, HUMAN if human else 0)
+        self._actions = bytearray()
+
+    def step(self, direction):
+        """Record the direction moved on one step."""
+        self._actions.append(DIR_INDEX[direction])
+
+    def end(self, score):
+        """Write the episode in progress with its final score, unless it has no steps."""
+        if self._actions:
+            self._file.write(EPISODE_HEADER.pack(*self._header, score, len(self._actions)))
+            self._file.write(self._actions)
+            self._file.flush()
+        self._actions = None
+
+    def close(self):
+        """Close the log. An episode in progress is discarded."""
+        self._actions = None
+        self._file.close()
+
+
+class EpisodeReader:
+    """
+    Memory-maps a log written by EpisodeWriter and indexes its episodes. The actions of
+    each episode are zero-copy views into the mapping, so logs of millions of steps are
+    streamed from the page cache rather than loaded.
+
+    Attributes:
+    path (str): The log file.
+    offsets (np.ndarray): The byte offset of each episode's actions.
+    seeds, cols, rows, flags, scores, steps (np.ndarray): The episode headers.
+    """
+
+    def __init__(self, path):
+        import numpy as np  # only reading needs numpy, so the human game can record without loading it
+
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, version = FILE_HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} episode log')
+
+        headers = []
+        offset = FILE_HEADER.size
+        end = len(self.data)
+        while offset + EPISODE_HEADER.size <= end:
+            header = EPISODE_HEADER.unpack_from(self.data, offset)
+            offset += EPISODE_HEADER.size
+            if offset + header[-1] > end:
+                break  # truncated by an interrupted write
+            headers.append(header + (offset,))
+            offset += header[-1]
+        columns = np.array(headers, dtype=np.int64).reshape(-1, 7).T
+        self.seeds, self.cols, self.rows, self.flags, self.scores, self.steps, self.offsets = columns
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        start = self.offsets[i]
+        return Episode(int(self.seeds[i]), int(self.cols[i]), int(self.rows[i]), bool(self.flags[i] & HUMAN),
+                       int(self.scores[i]), self.data[start:start + self.steps[i]])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def total_steps(self):
+        """The number of steps over all episodes."""
+        return int(self.steps.sum())
@@ -0,0 +1,112 @@
+import pygame as pg
+
+from settings import BLOCK_SIZE, BLACK, BLUE1, BLUE2, RED, WHITE
+
+
+class Renderer:
+    """
+    Draws a snake game onto a pygame display, redrawing only the cells that changed.
+
+    Between two consecutive frames only the new head, the vacated tail and the food can
+    change, so draw() repaints those cells and pushes just their rectangles with
+    pg.display.update. The score text is rendered once per score and blitted again only
+    when a repainted cell lies under it. A full redraw and flip happen on the first
+    frame, after invalidate(), and whenever frames were skipped (a new game, or
+    rendering switched back on), detected from the game's frame counter.
+
+    Attributes:
+    display (pygame.Surface): The display surface.
+    font (pygame.font.Font): The score font.
+    """
+
+    def __init__(self, display, font):
+        self.display = display
+        self.font = font
+        self.invalidate()
+
+    def invalidate(self):
+        """Force a full redraw on the next frame."""
+        self._frame = None
+        self._cells = ()
+        self._score = None
+        self._text = None
+        self._text_rect = pg.Rect(0, 0, 0, 0)
+
+    def draw(self, game):
+        """
+        Draw the current frame of a game.
+
+        Parameters:
+        game: A SnakeGameAI or Snake, read through its snake, food, score, board and
+            frame_iteration attributes.
+        """
+        frame = game.frame_iteration
+        if self._frame is None or frame != self._frame + 1:
+            self._draw_full(game)
+        else:
+            self._draw_dirty(game)
+        self._frame = frame
+        self._cells = (game.snake[0], game.snake[-1], game.food)
+
+    def _draw_full(self, game):
+        """Clear the screen, draw every cell and the score, and flip."""
+        self.display.fill(BLACK)
+        for pt in game.snake:
+            self._draw_body(pt)
+        if game.food not in game.board:
+            self._draw_food(game.food)
+        self._render_score(game.score)
+        self.display.blit(self._text, self._text_rect)
+        pg.display.flip()
+
+    def _draw_dirty(self, game):
+        """Repaint the cells that may have changed since the last frame and push their rectangles."""
+        dirty = []
+        for pt in set(self._cells + (game.snake[0], game.snake[-1], game.food)):
+            dirty.append(self._draw_cell(game, pt))
+
+        # The text is antialiased over the cells, so it is blitted again only over freshly painted cells
+        if game.score != self._score or self._text_rect.collidelist(dirty) != -1:
+            area = self._text_rect
+            if game.score != self._score:
+                self._render_score(game.score)
+                area = area.union(self._text_rect)  # the old text may be wider
+            for pt in self._cells_under(game, area):
+                self._draw_cell(game, pt)
+            self.display.blit(self._text, self._text_rect)
+            dirty.append(area)
+        pg.display.update(dirty)
+
+    def _render_score(self, score):
+        """Render the score text, cached until the score changes."""
+        self._score = score
+        self._text = self.font.render("Score: " + str(score), True, WHITE)
+        self._text_rect = self._text.get_rect(topleft=(0, 0))
+
+    def _cells_under(self, game, rect):
+        """Return the cells of the board overlapped by a pixel rectangle."""
+        board = game.board
+        xs = range(max(rect.left // BLOCK_SIZE, 0), min((rect.right - 1) // BLOCK_SIZE + 1, board.cols))
+        ys = range(max(rect.top // BLOCK_SIZE, 0), min((rect.bottom - 1) // BLOCK_SIZE + 1, board.rows))
+        return [board.point(y * board.cols + x) for y in ys for x in xs]
+
+    def _draw_cell(self, game, pt):
+        """Repaint one cell from the game's current state and return its rectangle."""
+        if pt in game.board:
+            return self._draw_body(pt)
+        if pt == game.food:
+            return self._draw_food(pt)
+        rect = pg.Rect(pt.x * BLOCK_SIZE, pt.y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE)
+        self.display.fill(BLACK, rect)
+        return rect
+
+    def _draw_body(self, pt):
+        """Draw one body segment and return its rectangle."""
+        x, y = pt.x * BLOCK_SIZE, pt.y * BLOCK_SIZE
+        rect = pg.draw.rect(self.display, BLUE1, pg.Rect(x, y, BLOCK_SIZE, BLOCK_SIZE))
+        pg.draw.rect(self.display, BLUE2, pg.Rect(x + 4, y + 4, 12, 12))
+        return rect
+
+    def _draw_food(self, pt):
+        """Draw the food and return its rectangle."""
+        return pg.draw.rect(self.display, RED, pg.Rect(pt.x * BLOCK_SIZE, pt.y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE))
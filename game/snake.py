@@ -1,50 +1,73 @@
 
 # Import settings
 from settings import *
+from api.render import Renderer
+from api.recording import EpisodeWriter
+import pygame as pg
 
 
 
 # Snake Game class
 class Snake:
-    def __init__(self) -> None:
+    def __init__(self, cols=COLS, rows=ROWS, record=None, seed=None) -> None:
+        """
+        cols, rows: the board size in cells.
+        record: when given, the game is appended to this episode log (see api.recording).
+        seed: seeds the food placement; drawn from the `random` module by default.
+        """
+        self.cols = cols
+        self.rows = rows
+        self.width = cols * BLOCK_SIZE
+        self.height = rows * BLOCK_SIZE
+        self.recorder = EpisodeWriter(record) if record else None
+        self.seed = random.getrandbits(32) if seed is None else seed
         self.initialize_game()
 
     def initialize_game(self):
         """Initialize the game settings and variables."""
         pg.init()
-        self.screen = pg.display.set_mode((WIDTH, HEIGHT))
+        self.screen = pg.display.set_mode((self.width, self.height))
         pg.display.set_caption('Snake-Intelligence')
         pg.font.init()
         self.timer_event = pg.USEREVENT + 1
         pg.time.set_timer(self.timer_event, 1000)
         self.clock = pg.time.Clock()
         self.font = pg.font.SysFont("Arial", 24, bold=True)
+        self.renderer = Renderer(self.screen, self.font)
+        self.rng = random.Random(self.seed)
+        if self.recorder is not None:
+            self.recorder.begin(self.seed, self.cols, self.rows, human=True)
         self.direction = Direction.RIGHT
-        self.head = Point(WIDTH // 2, HEIGHT // 2)
-        self.snake = [self.head,
-                      Point(self.head.x - BLOCK_SIZE, self.head.y),
-                      Point(self.head.x - (2 * BLOCK_SIZE), self.head.y)]
+        self.head = Point(self.cols // 2, self.rows // 2)
+        self.snake = deque([self.head,
+                            Point(self.head.x - 1, self.head.y),
+                            Point(self.head.x - 2, self.head.y)])
+        self.board = Board(self.cols, self.rows)
+        for pt in self.snake:
+            self.board.add(pt)
         self.score = 0
+        self.frame_iteration = 0
         self.food = None
         self.game_over = False
+        self.won = False
         self.place_food()
 
 
     def place_food(self):
-        """Place the food at a random location."""
-        x = random.randint(0, (WIDTH - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        y = random.randint(0, (HEIGHT - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        self.food = Point(x, y)
-        if self.food in self.snake:
-            self.place_food()
+        """Place the food on a random free cell, or win the game when the board is full."""
+        food = self.board.random_free(self.rng)
+        if food is None:
+            self.won = True
+        else:
+            self.food = food
 
     def is_collision(self):
         """Check if the snake has collided with itself or the boundaries."""
         # Hits boundary
-        if self.head.x >= WIDTH or self.head.x < 0 or self.head.y >= HEIGHT or self.head.y < 0:
+        if self.head.x >= self.cols or self.head.x < 0 or self.head.y >= self.rows or self.head.y < 0:
             return True
-        # Hits itself
-        if self.head in self.snake[1:]:
+        # Hits itself (the new head is checked before it joins the body)
+        if self.head in self.board and self.head != self.snake[0]:
             return True
         return False
 
@@ -65,34 +88,29 @@ class Snake:
                     self.direction = Direction.DOWN
 
     def update_display(self):
-        """Update the game display."""
-        pg.display.flip()
+        """Wait for the next frame; draw_elements has already pushed the changed cells to the display."""
         self.clock.tick(FPS)
 
     def move_snake(self):
-        """Move the snake in the current direction."""
+        """Move the snake's head one cell in the current direction; the body follows in check_game_status."""
         x = self.head.x
         y = self.head.y
         if self.direction == Direction.RIGHT:
-            x += BLOCK_SIZE
+            x += 1
         elif self.direction == Direction.LEFT:
-            x -= BLOCK_SIZE
+            x -= 1
         elif self.direction == Direction.DOWN:
-            y += BLOCK_SIZE
+            y += 1
         elif self.direction == Direction.UP:
-            y -= BLOCK_SIZE
+            y -= 1
         self.head = Point(x, y)
-        self.snake.insert(0, self.head)
+        self.frame_iteration += 1
+        if self.recorder is not None:
+            self.recorder.step(self.direction)
 
     def draw_elements(self):
-        """Draw the snake, food, and score on the screen."""
-        self.screen.fill(BLACK)
-        for pt in self.snake:
-            pg.draw.rect(self.screen, BLUE1, pg.Rect(pt.x, pt.y, BLOCK_SIZE, BLOCK_SIZE))
-            pg.draw.rect(self.screen, BLUE2, pg.Rect(pt.x + 4, pt.y + 4, 12, 12))
-        pg.draw.rect(self.screen, RED, pg.Rect(self.food.x, self.food.y, BLOCK_SIZE, BLOCK_SIZE))
-        text = self.font.render("Score: " + str(self.score), True, WHITE)
-        self.screen.blit(text, [0, 0])
+        """Draw the cells that changed since the last frame (snake, food and score) and update the display."""
+        self.renderer.draw(self)
 
     def handle_timer(self):
         """Handle the timer event."""
@@ -104,11 +122,16 @@ class Snake:
             self.game_over = True
             return self.game_over, self.score
 
+        self.snake.appendleft(self.head)
+        self.board.add(self.head)
         if self.head == self.food:
             self.score += 1
             self.place_food()
+            if self.won:
+                self.game_over = True
+                return self.game_over, self.score
         else:
-            self.snake.pop()
+            self.board.remove(self.snake.pop())
 
     def __call__(self):
         """Run the game loop."""
@@ -122,7 +145,13 @@ class Snake:
 
     def __del__(self):
         """Clean up resources and end the game."""
+        if self.won:
+            print('You Win!')
         print('Final Score', self.score)
+        if self.recorder is not None:
+            self.recorder.end(self.score)
+            self.recorder.close()
+            self.recorder = None
         pg.quit()
         print("Game is destroyed")
 
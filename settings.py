@@ -1,15 +1,11 @@
+# Only the standard library and api/ are imported here: every module does `from settings import *`,
+# so pygame, numpy and torch are imported by the modules that use them (see ai/benchmark.py --imports).
 import os
 import sys
 import random
-from pygame import *
-import pygame as pg
 from collections import deque
 from api.direction import Direction ,Point # Assuming Direction is defined in api.direction
-import torch
-import torch.nn as nn
-import torch.optim as optim
-import torch.nn.functional as F
-import numpy as np
+from api.board import Board
 
 # Screen resolution and frame rate
 RES = WIDTH, HEIGHT = (640, 480)
@@ -25,6 +21,7 @@ BLACK = (0, 0, 0)
 
 # Game settings
 BLOCK_SIZE = 20
+COLS, ROWS = WIDTH // BLOCK_SIZE, HEIGHT // BLOCK_SIZE  # default board size in cells (at least 4 x 1)
 
 # Directory paths
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -36,6 +33,77 @@ BATCH_SIZE = 1000
 LEARNING_RATE = 0.001
 LR = 0.001
 
+# Observation settings
+OBSERVATION = 'features'   # 'features' (11 flags), 'grid' (body, head and food planes) or 'grid_age' (plus body age)
+GRID_MAX_MEMORY = 20_000   # replay capacity with grid observations, which take channels * cols * rows bytes each
+FRAME_STACK = 1            # observations stacked into each state, the newest last
+N_STEP = 1                 # moves summed into the discounted returns replayed from memory
+
+# Training schedule and target network settings
+TRAIN_SHORT_MEMORY = True  # one gradient step on every move, besides the replay batches
+TRAIN_EVERY = 0            # moves between replay batch updates during a game (0: only when a game ends)
+TARGET_SYNC = 0            # updates between hard copies of the model to a target network (0: no target network)
+TARGET_TAU = 0.0           # when > 0, Polyak-average the target network by this much after every update instead
+DOUBLE_DQN = False         # the model picks the next action, the target network (if any) values it
+
+# Torch thread settings (0 keeps torch's default), applied by train() and train_vectorized()
+TORCH_THREADS = 0          # intra-op threads of each forward and backward pass
+TORCH_INTEROP_THREADS = 0  # inter-op threads; can only be set before torch starts parallel work
+
+# Prioritized experience replay settings
+PRIORITIZED_REPLAY = False
+PER_ALPHA = 0.6           # how much prioritization is used, 0 is uniform
+PER_BETA = 0.4            # initial importance-sampling exponent, annealed to 1
+PER_BETA_STEPS = 10_000   # sampled batches over which beta reaches 1
+PER_EPS = 0.01            # keeps zero-error transitions sampleable
+TARGET_MEAN_SCORE = 5     # mean score used to compare replay modes in ai/benchmark.py
+
+# Training display settings
+HEADLESS = False    # train without a window, event polling or frame limit
+RENDER_EVERY = 0    # when headless, render every N-th game (0 disables rendering)
+VECTOR_ENVS = 64    # games stepped in lockstep by train_vectorized
+CURRICULUM = None   # optional (from_game, cols, rows) board stages, e.g. [(0, 10, 10), (200, 20, 20)]
+
+# Training metrics settings
+METRICS_FILE = os.path.join(CURRENT_DIR, "ai", "logs", "metrics.jsonl")  # .jsonl or .csv
+METRICS_HISTORY = 1000   # records kept in memory by MetricsWriter
+PLOT_TRAINING = True     # plot the metrics live from a separate process (never when headless)
+PLOT_INTERVAL = 1.0      # seconds between plot refreshes
+PLOT_MAX_POINTS = 1000   # long histories are downsampled to about this many points
+
+# Checkpoint settings
+CHECKPOINT_DIR = os.path.join(CURRENT_DIR, "ai", "checkpoints")
+CHECKPOINT_EVERY = 50    # games between checkpoints (0 disables them)
+CHECKPOINT_KEEP = 2      # most recent checkpoints kept on disk
+SEED = None              # seed for Python, NumPy and torch; None leaves them unseeded
+
+# Policy inference server settings
+INFERENCE_MAX_BATCH = 256       # largest micro-batch of states per forward pass
+INFERENCE_MAX_LATENCY = 0.002   # seconds a request waits for its batch to fill
+INFERENCE_HOST = "127.0.0.1"
+INFERENCE_PORT = 8765
+INFERENCE_TIMEOUT = 5.0         # seconds an HTTP request waits for its actions before a 503
+INFERENCE_BACKEND = "numpy"     # "torch" (float32), "int8" (dynamic quantization) or "numpy" (fused float32 kernel)
+INT8_MIN_AGREEMENT = 0.99       # share of greedy actions an int8 model must keep, checked by ai.export
+
+# Evaluation settings
+EVAL_GAMES = 200                         # greedy games per evaluated model
+EVAL_PROCESSES = os.cpu_count() or 1     # evaluation worker processes
+
+# Startup import budgets, in seconds, checked by python -m ai.benchmark --imports
+IMPORT_BUDGETS = {
+    'game.snake': 0.5,     # the human game: pygame, which loads numpy itself when it is installed
+    'ai.snake_ai': 0.5,    # headless games: numpy only, pygame is loaded on first render
+    'ai.evaluate': 0.5,    # the evaluation parent process: torch is loaded by the workers
+    'ai.runtime': 0.3,     # exported policies: numpy only, no torch or pygame
+}
+
+# Multi-process actor/learner settings
+NUM_ACTORS = max(1, (os.cpu_count() or 2) - 1)  # actor processes, one core is left to the learner
+ACTOR_CHUNK = 256           # transitions an actor sends to the learner at a time
+ACTOR_SYNC_STEPS = 500      # moves an actor plays between checks for new weights
+LEARNER_PUBLISH_EVERY = 50  # learner updates between publishing weights to the actors
+
 
 AI = os.path.join(CURRENT_DIR,"ai")
 GAME = os.path.join(CURRENT_DIR,"game")